@@ -0,0 +1,180 @@
+"""Concurrent checkout stress test for stock reservations (PostgreSQL only).
+
+Worker threads hammer one product with reserve() calls, a fraction of them
+for more units than a single shard holds. Each successful hold is confirmed,
+released, or abandoned so the expiry sweeper has to return it. The run stops
+when stock is gone or time is up. The stock is then reset with set_stock()
+while abandoned holds are still live. It reports reservations per second and
+latency, then checks that nothing was oversold:
+
+    available + held + confirmed == initial stock, and no shard went negative
+
+    DATABASE_URL=postgresql://... python benchmarks/inventory_stress.py --workers 32 --stock 20000 --shards 8
+
+Point it at a scratch database: it resets the stock and reservations of the
+product under test.
+"""
+import argparse
+import random
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import delete, func, select
+from sqlmodel import Session, create_engine
+
+from config import DATABASE_URL
+from db import engine, init_db
+from inventory import confirm, expire_reservations, release, reserve, set_stock
+from models.inventory import Reservation, StockShard
+from models.products import Product
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--stock", type=int, default=20000)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--quantity", type=int, default=1, help="units per reservation")
+    parser.add_argument("--large-quantity", type=int, default=0,
+                        help="units per large reservation (default: more than one shard holds)")
+    parser.add_argument("--large-ratio", type=float, default=0.01, help="fraction of large reservations")
+    parser.add_argument("--seconds", type=float, default=60, help="stop early after this long")
+    parser.add_argument("--release-ratio", type=float, default=0.2)
+    parser.add_argument("--abandon-ratio", type=float, default=0.05, help="holds left to expire")
+    parser.add_argument("--ttl", type=int, default=2, help="hold lifetime in seconds")
+    parser.add_argument("--product-id", type=int)
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        sys.exit("inventory_stress needs a PostgreSQL DATABASE_URL (it relies on SKIP LOCKED)")
+
+    large_quantity = args.large_quantity or args.stock // args.shards + 1
+
+    init_db()
+    with Session(engine) as session:
+        product_id = args.product_id or session.exec(select(func.min(Product.id))).scalar_one()
+        if product_id is None:
+            sys.exit("No products in the database to reserve")
+        session.exec(delete(Reservation).where(Reservation.product_id == product_id))
+        session.exec(delete(StockShard).where(StockShard.product_id == product_id))
+        session.commit()
+        set_stock(session, product_id, args.stock, args.shards)
+
+    # One connection per worker and one for the sweeper, so latencies measure
+    # row locks rather than waits for the shared pool
+    worker_engine = create_engine(DATABASE_URL, pool_size=args.workers, max_overflow=0)
+    sweep_engine = create_engine(DATABASE_URL, pool_size=1)
+
+    latencies = []
+    outcomes = {"confirmed": 0, "released": 0, "abandoned": 0, "lost_race": 0, "large": 0, "large_refused": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+    deadline = time.perf_counter() + args.seconds
+
+    def worker(n):
+        user_id = f"bench-{n}"
+        local_latencies = []
+        local_outcomes = dict.fromkeys(outcomes, 0)
+        with Session(worker_engine) as session:
+            while not stop.is_set() and time.perf_counter() < deadline:
+                large = random.random() < args.large_ratio
+                started = time.perf_counter()
+                held = reserve(session, product_id, large_quantity if large else args.quantity,
+                               user_id=user_id, ttl=args.ttl)
+                local_latencies.append(time.perf_counter() - started)
+                if held is None and large:
+                    local_outcomes["large_refused"] += 1
+                    continue
+                if held is None:
+                    break
+                if large:
+                    local_outcomes["large"] += 1
+                roll = random.random()
+                if roll < args.abandon_ratio:
+                    local_outcomes["abandoned"] += 1
+                elif roll < args.abandon_ratio + args.release_ratio:
+                    ok = release(session, held["id"], user_id)
+                    local_outcomes["released" if ok else "lost_race"] += 1
+                else:
+                    ok = confirm(session, held["id"], user_id)
+                    local_outcomes["confirmed" if ok else "lost_race"] += 1
+        with lock:
+            latencies.extend(local_latencies)
+            for key, value in local_outcomes.items():
+                outcomes[key] += value
+
+    def sweeper():
+        with Session(sweep_engine) as session:
+            while not stop.wait(0.5):
+                expire_reservations(session)
+
+    sweep_thread = threading.Thread(target=sweeper)
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.workers)]
+    start = time.perf_counter()
+    sweep_thread.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    sweep_thread.join()
+
+    # Reset stock on hand while abandoned holds are still live; their units
+    # must only come back when they expire, not be made available twice
+    with Session(engine) as session:
+        confirmed = session.exec(
+            select(func.coalesce(func.sum(Reservation.quantity), 0))
+            .where(Reservation.product_id == product_id, Reservation.status == "confirmed")
+        ).scalar_one()
+        restocked = set_stock(session, product_id, args.stock - confirmed, args.shards)
+    print(f"set_stock({args.stock - confirmed}) with live holds -> available {restocked}")
+
+    # Let every abandoned hold lapse and return its stock before checking totals
+    time.sleep(args.ttl + 0.5)
+    with Session(engine) as session:
+        while expire_reservations(session):
+            pass
+        available, min_shard = session.exec(
+            select(func.coalesce(func.sum(StockShard.available), 0), func.min(StockShard.available))
+            .where(StockShard.product_id == product_id)
+        ).one()
+        reservations = session.exec(
+            select(func.count()).select_from(Reservation).where(Reservation.product_id == product_id)
+        ).scalar_one()
+        by_status = dict(session.exec(
+            select(Reservation.status, func.coalesce(func.sum(Reservation.quantity), 0))
+            .where(Reservation.product_id == product_id)
+            .group_by(Reservation.status)
+        ).all())
+
+    outstanding = by_status.get("held", 0) + by_status.get("confirmed", 0)
+    print(f"workers={args.workers} shards={args.shards} stock={args.stock} "
+          f"large={large_quantity} seconds={elapsed:.1f}")
+    print(f"reservations: {reservations} ({reservations / elapsed:.0f}/s)  outcomes: {outcomes}")
+    print(f"reserve latency: p50 {percentile(latencies, 50) * 1000:.1f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms  "
+          f"mean {statistics.mean(latencies) * 1000 if latencies else 0:.1f} ms")
+    print(f"stock: available={available} confirmed={by_status.get('confirmed', 0)} "
+          f"held={by_status.get('held', 0)} released={by_status.get('released', 0)} "
+          f"expired={by_status.get('expired', 0)} min shard={min_shard}")
+
+    consistent = available + outstanding == args.stock and min_shard >= 0 and outstanding <= args.stock
+    print("oversell check: " + ("OK" if consistent else "FAILED"))
+    sys.exit(0 if consistent else 1)
+
+
+if __name__ == "__main__":
+    main()
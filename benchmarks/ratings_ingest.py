@@ -0,0 +1,119 @@
+"""Sustained rating ingestion and fold lag against the configured database.
+
+Worker threads append votes through the same insert path as
+POST /api/products/{id}/ratings while a folder thread runs fold_ratings on a
+fixed interval. Reports votes/second accepted and, for every folded vote, the
+time between its insert committing and the fold that applied it.
+
+    DATABASE_URL=postgresql://... python benchmarks/ratings_ingest.py --workers 16 --seconds 30
+
+Point it at a scratch database: it writes real ratings and moves the
+aggregates of the first --products products.
+"""
+import argparse
+import random
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import select
+from sqlmodel import Session, create_engine
+
+from config import DATABASE_URL
+from db import engine, init_db
+from models.products import Product
+from ratings import fold_ratings, insert_rating
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--products", type=int, default=100, help="spread votes over this many products")
+    parser.add_argument("--fold-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    init_db()
+    with Session(engine) as session:
+        product_ids = session.exec(select(Product.id).order_by(Product.id).limit(args.products)).scalars().all()
+    if not product_ids:
+        sys.exit("No products in the database to rate")
+
+    inserted = {}  # rating id -> commit time
+    inserted_lock = threading.Lock()
+    folded = {}  # rating id -> time of the fold that applied it
+    folds = []
+    stop = threading.Event()
+
+    def worker():
+        with Session(engine) as session:
+            while not stop.is_set():
+                rating_id = insert_rating(session, random.choice(product_ids), random.randint(1, 5), "bench")
+                committed = time.perf_counter()
+                with inserted_lock:
+                    inserted[rating_id] = committed
+
+    # The workers can exhaust the shared pool; give the folder its own
+    # connection so fold lag isn't measuring pool waits
+    fold_engine = create_engine(DATABASE_URL, pool_size=1)
+
+    def folder():
+        while not stop.wait(args.fold_interval):
+            started = time.perf_counter()
+            with Session(fold_engine) as session:
+                result = fold_ratings(session)
+            finished = time.perf_counter()
+            if not result["ratings"]:
+                continue
+            folds.append((result["ratings"], len(result["products"]), finished - started))
+            # A vote can be folded before its worker records the commit time,
+            # so lags are matched up once both sides are in
+            with inserted_lock:
+                for rating_id in result["rating_ids"]:
+                    folded[rating_id] = finished
+
+    # Fold anything left over from earlier runs so it doesn't skew the first fold
+    with Session(engine) as session:
+        while fold_ratings(session)["ratings"]:
+            pass
+
+    threads = [threading.Thread(target=worker) for _ in range(args.workers)]
+    fold_thread = threading.Thread(target=folder)
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    fold_thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    fold_thread.join()
+
+    lags = [folded[rating_id] - committed for rating_id, committed in inserted.items() if rating_id in folded]
+    total = len(inserted)
+    print(f"workers={args.workers} products={len(product_ids)} seconds={elapsed:.1f}")
+    print(f"votes accepted: {total} ({total / elapsed:.0f}/s)")
+    if folds:
+        print(f"folds: {len(folds)}, "
+              f"mean {statistics.mean(f[0] for f in folds):.0f} votes / "
+              f"{statistics.mean(f[1] for f in folds):.0f} products per fold, "
+              f"mean fold time {statistics.mean(f[2] for f in folds) * 1000:.1f} ms")
+    print(f"consistency lag (insert -> aggregate): "
+          f"p50 {percentile(lags, 50):.2f}s  p95 {percentile(lags, 95):.2f}s  max {max(lags, default=0):.2f}s")
+    print(f"votes not yet folded at exit: {total - len(lags)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+from functools import lru_cache
+
+from fastapi import HTTPException
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import delete, func, select, update
+from sqlmodel import Session
+
+from models.categories import Category
+from models.subcategories import SubCategory
+from models.products import Product
+from models.brands import Brand
+from models.ratings import PendingRating, Rating
+from models.inventory import StockShard, Reservation
+
+
+# Max ids per statement when a request targets an explicit id list
+BATCH_SIZE = 1000
+
+# Rows that reference each model: (child model, filter on the child given a
+# subquery of parent ids). Children are deleted depth-first before parents.
+DEPENDENTS = {
+    Brand: [
+        (Product, lambda ids: Product.brand_id.in_(ids)),
+    ],
+    Category: [
+        (Product, lambda ids: Product.category_id.in_(ids)),
+        (SubCategory, lambda ids: SubCategory.category_id.in_(ids)),
+    ],
+    SubCategory: [
+        (Product, lambda ids: Product.subcategory_id.in_(ids)),
+    ],
+    Product: [
+        (Rating, lambda ids: Rating.product_id.in_(ids)),
+        (StockShard, lambda ids: StockShard.product_id.in_(ids)),
+        (Reservation, lambda ids: Reservation.product_id.in_(ids)),
+    ],
+    Rating: [
+        (PendingRating, lambda ids: PendingRating.rating_id.in_(ids)),
+    ],
+}
+
+
+# Columns the server maintains itself; bulk requests may neither set nor filter on them
+SERVER_COLUMNS = {
+    Product: {"rating_sum"},
+}
+
+
+def _column(model, name: str):
+    if name == "id" or name not in model.__table__.columns:
+        raise HTTPException(status_code=400, detail=f"Unknown {model.__tablename__} column: {name}")
+    if name in SERVER_COLUMNS.get(model, ()):
+        raise HTTPException(status_code=400, detail=f"{model.__tablename__}.{name} is maintained by the server")
+    return getattr(model, name)
+
+
+@lru_cache(maxsize=None)
+def _adapter(model, name: str) -> TypeAdapter:
+    return TypeAdapter(model.model_fields[name].annotation)
+
+
+def _value(model, name: str, value):
+    """Check a request value against the model field's type before it reaches SQL."""
+    _column(model, name)
+    try:
+        return _adapter(model, name).validate_python(value)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Invalid value for {model.__tablename__}.{name}: {e.errors()[0]['msg']}"
+        )
+
+
+def _batches(model, ids: list[int] | None, where: dict):
+    """Yield the WHERE criteria for each statement of a bulk request."""
+    criteria = [_column(model, name) == _value(model, name, value) for name, value in where.items()]
+    if ids is None:
+        if not criteria:
+            raise HTTPException(status_code=400, detail="Provide ids or where criteria")
+        yield criteria
+        return
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield criteria + [model.id.in_(ids[start:start + BATCH_SIZE])]
+
+
+def bulk_update(session: Session, model, ids: list[int] | None, where: dict, values: dict) -> list[dict]:
+    """Apply `values` to every matching row, one UPDATE ... RETURNING per batch."""
+    if not values:
+        raise HTTPException(status_code=400, detail="No values to update")
+    values = {name: _value(model, name, value) for name, value in values.items()}
+    returning = [model.id] + [_column(model, name) for name in values]
+    # An edited rating average no longer matches the running total behind it
+    if model is Product and {"rating_value", "rating_count"} & set(values):
+        values.setdefault("rating_sum", None)
+    rows = []
+    for criteria in _batches(model, ids, where):
+        stmt = update(model).where(*criteria).values(**values).returning(*returning)
+        result = session.exec(stmt, execution_options={"synchronize_session": False})
+        rows.extend(dict(row) for row in result.mappings())
+    return rows
+
+
+def count_dependents(session: Session, model, criteria: list) -> dict:
+    parent_ids = select(model.id).where(*criteria)
+    counts = {}
+    for child, link in DEPENDENTS.get(model, []):
+        count = session.exec(select(func.count()).select_from(child).where(link(parent_ids))).scalar_one()
+        if count:
+            counts[child.__tablename__] = counts.get(child.__tablename__, 0) + count
+    return counts
+
+
+def _delete_where(session: Session, model, criteria: list, deleted: dict, product_ids: list) -> list[int]:
+    for child, link in DEPENDENTS.get(model, []):
+        child_ids = _delete_where(session, child, [link(select(model.id).where(*criteria))], deleted, product_ids)
+        if child_ids:
+            deleted[child.__tablename__] = deleted.get(child.__tablename__, 0) + len(child_ids)
+        if child is Product:
+            product_ids.extend(child_ids)
+    # Leaf tables like stock_shards have a composite key and no id column
+    stmt = delete(model).where(*criteria).returning(*model.__table__.primary_key.columns)
+    result = session.exec(stmt, execution_options={"synchronize_session": False})
+    return [row[0] for row in result]
+
+
+def bulk_delete(session: Session, model, ids: list[int] | None, where: dict, cascade: bool) -> tuple[dict, list[int]]:
+    """Delete matching rows, one DELETE ... RETURNING per batch.
+
+    Rows referenced by other tables are refused with 409 unless `cascade` is
+    set, in which case the dependents are deleted first in the same
+    transaction. Returns the response body and the ids of every product
+    removed, directly or by cascade, so in-memory indexes can drop them.
+    """
+    deleted_ids = []
+    dependents = {}
+    product_ids = []
+    for criteria in _batches(model, ids, where):
+        if not cascade:
+            blocking = count_dependents(session, model, criteria)
+            if blocking:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Rows are still referenced by {blocking}; pass cascade=true to delete them too"
+                )
+        deleted_ids.extend(_delete_where(session, model, criteria, dependents, product_ids))
+    if model is Product:
+        product_ids.extend(deleted_ids)
+    return {"deleted": deleted_ids, "dependents": dependents}, product_ids
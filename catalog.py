@@ -0,0 +1,67 @@
+import json
+
+from sqlalchemy import func, select
+from sqlmodel import Session
+
+from models.categories import Category
+from models.subcategories import SubCategory
+from models.products import Product
+from versions import CATALOG, current_version
+
+
+# Serialized /api/catalog/tree response and the CATALOG version it was built
+# at. Every handler that changes categories, subcategories or which products
+# they hold bumps that version, so a cache hit costs one primary key lookup.
+# (blob, version), swapped as a whole so readers never mix entries
+_tree_cache = None
+
+
+def build_tree(session: Session) -> list:
+    """Categories with nested subcategories and product counts, from one query."""
+    query = select(
+        Category.id,
+        Category.name,
+        Category.emoji,
+        SubCategory.id.label("subcategory_id"),
+        SubCategory.name.label("subcategory_name"),
+        func.count(Product.id).label("product_count"),
+    ).select_from(Category).outerjoin(
+        SubCategory, SubCategory.category_id == Category.id
+    ).outerjoin(
+        Product, Product.subcategory_id == SubCategory.id
+    ).group_by(
+        Category.id, Category.name, Category.emoji, SubCategory.id, SubCategory.name
+    ).order_by(Category.id, SubCategory.id)
+
+    tree = {}
+    for row in session.exec(query):
+        node = tree.get(row.id)
+        if node is None:
+            node = tree[row.id] = {
+                "id": row.id,
+                "name": row.name,
+                "emoji": row.emoji,
+                "product_count": 0,
+                "subcategories": [],
+            }
+        if row.subcategory_id is not None:
+            node["subcategories"].append({
+                "id": row.subcategory_id,
+                "name": row.subcategory_name,
+                "product_count": row.product_count,
+            })
+            node["product_count"] += row.product_count
+    return list(tree.values())
+
+
+def get_tree_blob(session: Session) -> bytes:
+    global _tree_cache
+    # Read the version before the tree, so the cached tree is never older
+    # than the version it is stored under
+    version = current_version(session, CATALOG)
+    cache = _tree_cache
+    if cache is not None and cache[1] == version:
+        return cache[0]
+    blob = json.dumps(build_tree(session), ensure_ascii=False).encode("utf-8")
+    _tree_cache = (blob, version)
+    return blob
@@ -7,4 +7,37 @@ load_dotenv(dotenv_path=env_path)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 SUPABASE_SECRET_KEY = os.getenv("SUPABASE_SECRET_KEY")
-JWT_ALGORITHM = os.getenv("JWT_ALGORITHM")
\ No newline at end of file
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM")
+
+# Logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Per-module overrides, e.g. "sqlalchemy.engine=INFO,main=DEBUG"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "sqlalchemy.engine=WARNING")
+# Fraction of INFO/DEBUG records kept; warnings and errors are never sampled
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+# Request profiling
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+
+# Rankings
+# Number of "virtual" average ratings blended into each product's score
+RANKING_PRIOR_WEIGHT = int(os.getenv("RANKING_PRIOR_WEIGHT", "50"))
+
+# Related products
+RELATED_INDEX_PATH = os.getenv("RELATED_INDEX_PATH", "related_index.npz")
+RELATED_TOP_N = int(os.getenv("RELATED_TOP_N", "20"))
+# Seconds between checks for products added or deleted by other processes
+RELATED_SYNC_INTERVAL = float(os.getenv("RELATED_SYNC_INTERVAL", "30"))
+
+# Ratings
+# Seconds between folds of new ratings into products.rating_value/rating_count
+RATING_FOLD_INTERVAL = float(os.getenv("RATING_FOLD_INTERVAL", "5"))
+# Max votes applied per fold transaction; a bigger backlog takes several folds
+RATING_FOLD_BATCH = int(os.getenv("RATING_FOLD_BATCH", "5000"))
+
+# Inventory
+# Seconds a reservation holds stock before the sweeper returns it
+RESERVATION_TTL = int(os.getenv("RESERVATION_TTL", "900"))
+INVENTORY_SWEEP_INTERVAL = float(os.getenv("INVENTORY_SWEEP_INTERVAL", "10"))
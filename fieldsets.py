@@ -0,0 +1,93 @@
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from models.categories import Category
+from models.subcategories import SubCategory
+from models.products import Product
+from models.brands import Brand
+
+
+# Response field -> model column for each listing endpoint. The order here is
+# the order fields appear in the response when no `fields=` is given.
+PRODUCT_FIELDS = {
+    "id": Product.id,
+    "name": Product.name,
+    "brand_id": Product.brand_id,
+    "brand_name": Brand.name,
+    "price": Product.price,
+    "description": Product.description,
+    "image_url": Product.image_url,
+    "rating_value": Product.rating_value,
+    "rating_count": Product.rating_count,
+    "category_name": Category.name,
+    "subcategory_name": SubCategory.name,
+}
+
+BRAND_FIELDS = {
+    "id": Brand.id,
+    "name": Brand.name,
+}
+
+CATEGORY_FIELDS = {
+    "id": Category.id,
+    "name": Category.name,
+    "emoji": Category.emoji,
+}
+
+SUBCATEGORY_FIELDS = {
+    "id": SubCategory.id,
+    "name": SubCategory.name,
+    "category_id": SubCategory.category_id,
+    "category_name": Category.name,
+}
+
+
+def parse_fields(fields: str | None, available: dict) -> dict:
+    """Resolve a comma separated `fields=` value to the columns to select."""
+    if not fields:
+        return available
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in available]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown) or fields}. Allowed: {', '.join(available)}"
+        )
+    return {name: available[name] for name in dict.fromkeys(requested)}
+
+
+def select_fields(columns: dict):
+    """Build a column-level select that labels each column with its response name.
+
+    Uses the plain SQLAlchemy `select` so single-column projections still come
+    back as rows rather than scalars.
+    """
+    return select(*[column.label(name) for name, column in columns.items()])
+
+
+def uses_model(columns: dict, model) -> bool:
+    return any(column.class_ is model for column in columns.values())
+
+
+def select_products(columns: dict, join_category: bool = False):
+    """Select PRODUCT_FIELDS columns, joining only the tables they come from.
+
+    Pass join_category=True when the caller filters on Category or SubCategory.
+    """
+    query = select_fields(columns).select_from(Product)
+    if join_category or uses_model(columns, SubCategory) or uses_model(columns, Category):
+        query = query.join(
+            SubCategory, Product.subcategory_id == SubCategory.id
+        ).join(
+            Category, SubCategory.category_id == Category.id
+        )
+    if uses_model(columns, Brand):
+        query = query.join(Brand, Product.brand_id == Brand.id)
+    return query
+
+
+def strip_id(row: dict, columns: dict) -> dict:
+    """Drop the `id` selected for internal lookups unless the caller asked for it."""
+    if "id" in columns:
+        return row
+    return {name: value for name, value in row.items() if name != "id"}
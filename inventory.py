@@ -0,0 +1,250 @@
+from datetime import timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import String, func, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session
+
+from config import RESERVATION_TTL
+from models.inventory import StockShard, Reservation
+from models.ratings import utcnow
+
+
+# Attempts that skip shards locked by other checkouts before one final
+# attempt that waits for a lock. Skipping keeps hot products from queueing
+# on a single row; the last attempt stops "all shards busy" from being
+# reported as out of stock. It picks its shard without locking and then
+# waits on that one row only: a locking pick can end up holding a shard that
+# failed the recheck while waiting on another, and deadlock.
+RESERVE_ATTEMPTS = 3
+
+SWEEP_BATCH_SIZE = 1000
+
+
+def held_quantity(session: Session, product_id: int) -> int:
+    return session.exec(
+        select(func.coalesce(func.sum(Reservation.quantity), 0)).where(
+            Reservation.product_id == product_id, Reservation.status == "held"
+        )
+    ).scalar_one()
+
+
+def set_stock(session: Session, product_id: int, quantity: int, shards: int):
+    """Set the product's stock on hand to `quantity` units, spread over `shards` rows.
+
+    `quantity` includes units in live holds: those come back to their shard
+    when released or expired, so only the rest is made available now. The
+    product's shards are locked first so no hold can be taken or returned
+    between reading the held total and writing the shards.
+
+    Shards beyond the new count are emptied rather than deleted so holds that
+    still point at them can be released back.
+    """
+    session.exec(
+        select(StockShard.shard).where(StockShard.product_id == product_id)
+        .order_by(StockShard.shard).with_for_update()
+    ).all()
+    held = held_quantity(session, product_id)
+    if quantity < held:
+        session.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail=f"Quantity {quantity} is below the {held} units held by open reservations"
+        )
+
+    per_shard, extra = divmod(quantity - held, shards)
+    rows = [
+        {"product_id": product_id, "shard": shard, "available": per_shard + (1 if shard < extra else 0)}
+        for shard in range(shards)
+    ]
+    session.exec(
+        update(StockShard).where(
+            StockShard.product_id == product_id, StockShard.shard >= shards
+        ).values(available=0)
+    )
+    stmt = pg_insert(StockShard).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StockShard.product_id, StockShard.shard],
+        set_={"available": stmt.excluded.available},
+    )
+    session.exec(stmt)
+    session.commit()
+    return quantity - held
+
+
+def get_stock(session: Session, product_id: int) -> int:
+    return session.exec(
+        select(func.coalesce(func.sum(StockShard.available), 0)).where(StockShard.product_id == product_id)
+    ).scalar_one()
+
+
+def _hold(reservation_id: int, product_id: int, quantity: int, expires_at) -> dict:
+    return {
+        "id": reservation_id,
+        "product_id": product_id,
+        "quantity": quantity,
+        "status": "held",
+        "expires_at": expires_at,
+    }
+
+
+def reserve(session: Session, product_id: int, quantity: int, cart_id: str = None,
+            user_id: str = None, ttl: int = RESERVATION_TTL) -> dict | None:
+    """Hold stock for a checkout, or return None if the product can't cover it.
+
+    Each attempt is a single statement: lock one random shard with enough
+    stock, decrement it and insert the hold, all in one round trip. Orders
+    no single shard can cover fall back to _reserve_across_shards.
+    """
+    for attempt in range(RESERVE_ATTEMPTS):
+        candidate = select(StockShard.shard).where(
+            StockShard.product_id == product_id, StockShard.available >= quantity
+        ).order_by(func.random()).limit(1)
+        if attempt < RESERVE_ATTEMPTS - 1:
+            candidate = candidate.with_for_update(skip_locked=True)
+        # Joined as a CTE rather than a scalar subquery: when the UPDATE has
+        # to wait for the row, postgres re-runs a subquery while rechecking
+        # it, and a fresh random pick then matches nothing
+        candidate = candidate.cte("candidate")
+        taken = update(StockShard).where(
+            StockShard.product_id == product_id,
+            StockShard.shard == candidate.c.shard,
+            StockShard.available >= quantity,
+        ).values(
+            available=StockShard.available - quantity
+        ).returning(StockShard.product_id, StockShard.shard).cte("taken")
+
+        expires_at = utcnow() + timedelta(seconds=ttl)
+        stmt = insert(Reservation).from_select(
+            ["product_id", "shard", "quantity", "status", "cart_id", "user_id", "created_at", "expires_at"],
+            select(
+                taken.c.product_id, taken.c.shard, literal(quantity), literal("held"),
+                literal(cart_id, String), literal(user_id, String), literal(utcnow()), literal(expires_at),
+            ),
+        ).returning(Reservation.id, Reservation.shard)
+        row = session.exec(stmt).one_or_none()
+        session.commit()
+        if row is not None:
+            return _hold(row.id, product_id, quantity, expires_at)
+
+    # Only worth locking every shard if the product has enough stock in total
+    if get_stock(session, product_id) < quantity:
+        session.rollback()
+        return None
+    return _reserve_across_shards(session, product_id, quantity, cart_id, user_id, ttl)
+
+
+def _reserve_across_shards(session: Session, product_id: int, quantity: int, cart_id: str,
+                           user_id: str, ttl: int) -> dict | None:
+    """Move stock into the fullest shard until it covers `quantity`, then hold it there.
+
+    Locks every shard of the product, waiting if needed, in shard order like
+    set_stock and the expiry sweeper so the three can't deadlock. Units are
+    only moved between shards, and the hold is recorded against the one
+    shard that release and expiry return it to.
+    """
+    shards = session.exec(
+        select(StockShard.shard, StockShard.available).where(StockShard.product_id == product_id)
+        .order_by(StockShard.shard).with_for_update()
+    ).all()
+    if sum(shard.available for shard in shards) < quantity:
+        session.rollback()
+        return None
+
+    target, *others = sorted(shards, key=lambda shard: -shard.available)
+    gathered = target.available
+    for shard in others:
+        if gathered >= quantity:
+            break
+        moved = min(shard.available, quantity - gathered)
+        session.exec(
+            update(StockShard).where(
+                StockShard.product_id == product_id, StockShard.shard == shard.shard
+            ).values(available=shard.available - moved)
+        )
+        gathered += moved
+    session.exec(
+        update(StockShard).where(
+            StockShard.product_id == product_id, StockShard.shard == target.shard
+        ).values(available=gathered - quantity)
+    )
+
+    expires_at = utcnow() + timedelta(seconds=ttl)
+    reservation_id = session.exec(
+        insert(Reservation).values(
+            product_id=product_id, shard=target.shard, quantity=quantity, status="held",
+            cart_id=cart_id, user_id=user_id, created_at=utcnow(), expires_at=expires_at,
+        ).returning(Reservation.id)
+    ).scalar_one()
+    session.commit()
+    return _hold(reservation_id, product_id, quantity, expires_at)
+
+
+def confirm(session: Session, reservation_id: int, user_id: str = None) -> bool:
+    """Turn a live hold into a sale. The stock stays decremented."""
+    stmt = update(Reservation).where(
+        Reservation.id == reservation_id,
+        Reservation.user_id == user_id,
+        Reservation.status == "held",
+        Reservation.expires_at > utcnow(),
+    ).values(status="confirmed").returning(Reservation.id)
+    row = session.exec(stmt, execution_options={"synchronize_session": False}).one_or_none()
+    session.commit()
+    return row is not None
+
+
+def release(session: Session, reservation_id: int, user_id: str = None) -> bool:
+    """Cancel a live hold and return its quantity to the shard it came from."""
+    released = update(Reservation).where(
+        Reservation.id == reservation_id,
+        Reservation.user_id == user_id,
+        Reservation.status == "held",
+    ).values(status="released").returning(
+        Reservation.product_id, Reservation.shard, Reservation.quantity
+    ).cte("released")
+    stmt = update(StockShard).where(
+        StockShard.product_id == released.c.product_id,
+        StockShard.shard == released.c.shard,
+    ).values(
+        available=StockShard.available + released.c.quantity
+    ).returning(StockShard.shard)
+    row = session.exec(stmt, execution_options={"synchronize_session": False}).one_or_none()
+    session.commit()
+    return row is not None
+
+
+def expire_reservations(session: Session, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """Return stock from up to `batch_size` lapsed holds in one statement.
+
+    Holds being confirmed or released concurrently are skipped, not waited on.
+    """
+    lapsed = select(Reservation.id).where(
+        Reservation.status == "held", Reservation.expires_at <= utcnow()
+    ).order_by(Reservation.id).limit(batch_size).with_for_update(skip_locked=True)
+    expired = update(Reservation).where(
+        Reservation.id.in_(lapsed.scalar_subquery()), Reservation.status == "held"
+    ).values(status="expired").returning(
+        Reservation.product_id, Reservation.shard, Reservation.quantity
+    ).cte("expired")
+    totals = select(
+        expired.c.product_id,
+        expired.c.shard,
+        func.sum(expired.c.quantity).label("quantity"),
+        func.count().label("holds"),
+    ).group_by(expired.c.product_id, expired.c.shard).cte("totals")
+    # Take the shard locks in (product, shard) order, as _reserve_across_shards
+    # and set_stock do, before any of them is updated
+    locked = select(StockShard.product_id, StockShard.shard).join(
+        totals, (StockShard.product_id == totals.c.product_id) & (StockShard.shard == totals.c.shard)
+    ).order_by(StockShard.product_id, StockShard.shard).with_for_update(of=StockShard).cte("locked")
+    stmt = update(StockShard).where(
+        StockShard.product_id == totals.c.product_id,
+        StockShard.shard == totals.c.shard,
+        StockShard.product_id == locked.c.product_id,
+        StockShard.shard == locked.c.shard,
+    ).values(
+        available=StockShard.available + totals.c.quantity
+    ).returning(totals.c.holds)
+    holds = sum(row.holds for row in session.exec(stmt, execution_options={"synchronize_session": False}))
+    session.commit()
+    return holds
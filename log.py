@@ -0,0 +1,154 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from starlette.datastructures import MutableHeaders
+
+from config import LOG_LEVEL, LOG_LEVELS, LOG_SAMPLE_RATE
+
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+_listener = None
+
+# Attributes every LogRecord has; anything else was passed via `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "request_id"}
+
+
+# Client supplied ids end up in every log line, so only short plain tokens are kept
+_REQUEST_ID = re.compile(r"[A-Za-z0-9-]{1,64}")
+
+
+def new_request_id(header_value: str = None) -> str:
+    if header_value and _REQUEST_ID.fullmatch(header_value):
+        request_id = header_value
+    else:
+        request_id = uuid.uuid4().hex
+    request_id_var.set(request_id)
+    return request_id
+
+
+class RequestIdMiddleware:
+    """Give each request an id for its log lines and echo it as X-Request-ID.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so the handler runs in the
+    same task (and sees request_id_var) without the response being re-streamed.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        header = dict(scope["headers"]).get(b"x-request-id")
+        request_id = new_request_id(header.decode("latin-1") if header else None)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Request-ID"] = request_id
+            await send(message)
+
+        await self.app(scope, receive, send_with_request_id)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the current request id and sample low-severity records.
+
+    Runs on the emitting thread, so the request id is read from the caller's
+    context before the record crosses the queue.
+    """
+
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if record.levelno <= logging.INFO and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    # The stock prepare() formats the record on the calling thread. Only merge
+    # the args so mutable arguments can't change underneath us, and leave
+    # formatting (including tracebacks) to the listener thread.
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Route all logging through a queue to a background JSON writer.
+
+    Safe to call more than once; only the first call installs handlers.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JSONFormatter())
+
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter(LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL.upper())
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    # Uvicorn installs its own stream handlers; send its output through ours
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers[:] = []
+        uvicorn_logger.propagate = True
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
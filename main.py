@@ -1,19 +1,48 @@
 import uvicorn
 import jwt
+import asyncio
+import logging
+import threading
 from typing import Annotated
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlmodel import Field, Session, select, SQLModel
-from db import get_session, init_db
-from config import SUPABASE_SECRET_KEY, JWT_ALGORITHM
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, Session, SQLModel
+from db import engine, get_session, init_db
+from log import RequestIdMiddleware, setup_logging
+from profiling import ProfilingMiddleware, profiling_control, list_profiles, profile_path
+from catalog import get_tree_blob
+from bulk import bulk_update, bulk_delete
+from rankings import SORTS, ranking_index, ranking_rows
+from versions import CATALOG, RANKINGS, bump_version, current_version
+from related import RELATED_COLUMNS, related_index, related_rows, load_related_index, sync_related_index
+from ratings import insert_rating, fold_ratings
+from inventory import SWEEP_BATCH_SIZE, set_stock, get_stock, reserve, confirm, release, expire_reservations
+from config import (
+    SUPABASE_SECRET_KEY, JWT_ALGORITHM, RELATED_TOP_N, RELATED_SYNC_INTERVAL, RATING_FOLD_INTERVAL,
+    RATING_FOLD_BATCH, INVENTORY_SWEEP_INTERVAL,
+)
+from fieldsets import (
+    PRODUCT_FIELDS, BRAND_FIELDS, CATEGORY_FIELDS, SUBCATEGORY_FIELDS,
+    parse_fields, select_fields, select_products, strip_id, uses_model,
+)
 
 from models.categories import Category
 from models.subcategories import SubCategory
 from models.products import Product
 from models.brands import Brand
+from models.bulk import BulkUpdate, BulkDelete
+from models.profiling import ProfilingRequest
+from models.ratings import RatingCreate
+from models.inventory import StockUpdate, ReservationCreate
+
 
+setup_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -34,6 +63,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(ProfilingMiddleware)
+
+# Added last so it runs first and the request id is set for everything below
+app.add_middleware(RequestIdMiddleware)
+
 # Mount the Media directory
 app.mount("/media", StaticFiles(directory="../crudco/media"), name="media")
 
@@ -57,78 +91,149 @@ def root():
 
 
 @app.get("/api/products/")
-async def get_products(category: str, db: Session = Depends(get_session)):
+async def get_products(category: str, fields: str = None, db: Session = Depends(get_session)):
+    columns = parse_fields(fields, PRODUCT_FIELDS)
     try:
-        query = select(Product, SubCategory, Category, Brand).join(
-            SubCategory, Product.subcategory_id == SubCategory.id
-        ).join(
-            Category, SubCategory.category_id == Category.id
-        ).join(
-            Brand, Product.brand_id == Brand.id
-        ).where(Category.name.ilike(f"%{category}%"))
+        query = select_products(columns, join_category=True).where(
+            Category.name.ilike(f"%{category}%")
+        )
         
-        results = db.exec(query).all()
+        results = db.exec(query).mappings().all()
         
         if not results:
             raise HTTPException(status_code=404, detail=f"No products found for category: {category}")
         
-        return [{
-            "name": product.name,
-            "brand_id": product.brand_id,
-            "brand_name": brand.name,
-            "price": product.price,
-            "description": product.description,
-            "image_url": product.image_url,
-            "rating_value": product.rating_value,
-            "rating_count": product.rating_count,
-            "category_name": category.name,
-            "subcategory_name": subcategory.name
-        } for product, subcategory, category, brand in results]
+        return [dict(row) for row in results]
     except Exception as e:
-        print(f"Error in get_products: {str(e)}")
+        logger.exception("Error in get_products")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
 
 @app.get("/api/brands/")
-async def get_brands(db: Session = Depends(get_session)):
+async def get_brands(fields: str = None, db: Session = Depends(get_session)):
+    columns = parse_fields(fields, BRAND_FIELDS)
     try:
-        query = select(Brand)
-        results = db.exec(query).all()
-        return [{"id": brand.id, "name": brand.name} for brand in results]
+        query = select_fields(columns).select_from(Brand)
+        results = db.exec(query).mappings().all()
+        return [dict(row) for row in results]
     except Exception as e:
-        print(f"Error in get_brands: {str(e)}")
+        logger.exception("Error in get_brands")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
 
 @app.get("/api/categories/")
-async def get_categories(db: Session = Depends(get_session)):
+async def get_categories(fields: str = None, db: Session = Depends(get_session)):
+    columns = parse_fields(fields, CATEGORY_FIELDS)
     try:
-        query = select(Category)
-        results = db.exec(query).all()
-        return [{"id": category.id, "name": category.name, "emoji": category.emoji} for category in results]
+        query = select_fields(columns).select_from(Category)
+        results = db.exec(query).mappings().all()
+        return [dict(row) for row in results]
     except Exception as e:
-        print(f"Error in get_categories: {str(e)}")
+        logger.exception("Error in get_categories")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
 
 @app.get("/api/subcategories/")
-async def get_subcategories(category_id: int = None, db: Session = Depends(get_session)):
+async def get_subcategories(category_id: int = None, fields: str = None, db: Session = Depends(get_session)):
+    columns = parse_fields(fields, SUBCATEGORY_FIELDS)
     try:
-        query = select(SubCategory, Category).join(Category, SubCategory.category_id == Category.id)
+        query = select_fields(columns).select_from(SubCategory)
+        if uses_model(columns, Category):
+            query = query.join(Category, SubCategory.category_id == Category.id)
         if category_id:
             query = query.where(SubCategory.category_id == category_id)
-        results = db.exec(query).all()
-        return [{
-            "id": subcategory.id,
-            "name": subcategory.name,
-            "category_id": subcategory.category_id,
-            "category_name": category.name
-        } for subcategory, category in results]
+        results = db.exec(query).mappings().all()
+        return [dict(row) for row in results]
     except Exception as e:
-        print(f"Error in get_subcategories: {str(e)}")
+        logger.exception("Error in get_subcategories")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+
+@app.get("/api/catalog/tree")
+async def get_catalog_tree(db: Session = Depends(get_session)):
+    try:
+        return Response(content=get_tree_blob(db), media_type="application/json")
+    except Exception as e:
+        logger.exception("Error in get_catalog_tree")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+
+@app.get("/api/rankings/")
+async def get_rankings(
+    category_id: int = None,
+    subcategory_id: int = None,
+    sort: str = "top_rated",
+    k: int = Query(default=10, ge=1, le=100),
+    fields: str = None,
+    db: Session = Depends(get_session)
+):
+    if sort not in SORTS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort: {sort}. Allowed: {', '.join(SORTS)}")
+    columns = parse_fields(fields, PRODUCT_FIELDS)
+    try:
+        version = current_version(db, RANKINGS)
+        if not ranking_index.is_current(version):
+            await run_in_threadpool(ranking_index.rebuild, db, version)
+        ranked = ranking_index.top(sort, category_id, subcategory_id, k)
+        if not ranked:
+            return []
+        
+        query = select_products({"id": Product.id, **columns}).where(
+            Product.id.in_([product_id for product_id, _ in ranked])
+        )
+        
+        rows = {row["id"]: dict(row) for row in db.exec(query).mappings()}
+        return [
+            {**strip_id(rows[product_id], columns), "score": score}
+            for product_id, score in ranked if product_id in rows
+        ]
+    except Exception as e:
+        logger.exception("Error in get_rankings")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+
+@app.get("/api/products/{product_id}/related")
+async def get_related_products(
+    product_id: int,
+    limit: int = Query(default=10, ge=1, le=RELATED_TOP_N),
+    fields: str = None,
+    db: Session = Depends(get_session)
+):
+    columns = parse_fields(fields, PRODUCT_FIELDS)
+    if not related_index.ready:
+        raise HTTPException(status_code=503, detail="Related products index is still building")
+    related = related_index.related(product_id, limit)
+    try:
+        if related is None:
+            # Not indexed yet, e.g. added through another process since startup
+            product = db.get(Product, product_id)
+            if product is None:
+                raise HTTPException(status_code=404, detail=f"Product with id {product_id} not found")
+            await run_in_threadpool(
+                related_index.add, product.id, product.name, product.description,
+                product.brand_id, product.subcategory_id
+            )
+            related = related_index.related(product_id, limit) or []
+        if not related:
+            return []
+        query = select_products({"id": Product.id, **columns}).where(
+            Product.id.in_([other_id for other_id, _ in related])
+        )
+        rows = {row["id"]: dict(row) for row in db.exec(query).mappings()}
+        return [
+            {**strip_id(rows[other_id], columns), "score": score}
+            for other_id, score in related if other_id in rows
+        ]
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in get_related_products")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
@@ -148,16 +253,243 @@ async def add_product(
     
     try:
         # Exclude id when creating new product
-        product_data = product.model_dump(exclude={'id'})
+        product_data = product.model_dump(exclude={'id', 'rating_sum'})
         db_product = Product(**product_data)
         session.add(db_product)
+        bump_version(session, CATALOG)
+        rankings_version = bump_version(session, RANKINGS)
         session.commit()
         session.refresh(db_product)
-        return {"message": f"Product Added: {db_product.name}", "product": db_product}
     except Exception as e:
         session.rollback()
+        logger.exception("Error creating product")
         raise HTTPException(status_code=500, detail=f"Error creating product: {str(e)}")
+
+    # The product is saved at this point; a failed index update is logged
+    # rather than reported as a failed request.
+    try:
+        ranking_index.upsert(rankings_version, [(
+            db_product.id, db_product.category_id, db_product.subcategory_id,
+            db_product.rating_value, db_product.rating_count
+        )])
+    except Exception:
+        logger.exception("Error adding product to rankings", extra={"product_id": db_product.id})
+    try:
+        await run_in_threadpool(
+            related_index.add, db_product.id, db_product.name, db_product.description,
+            db_product.brand_id, db_product.subcategory_id
+        )
+    except Exception:
+        logger.exception("Error adding product to related index", extra={"product_id": db_product.id})
+    return {"message": f"Product Added: {db_product.name}", "product": db_product}
+    
+
+
+
+@app.patch("/products/auth/bulk")
+async def bulk_update_products_auth(
+    request: BulkUpdate,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    session: Session = Depends(get_session)
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
     
+    verify_token(credentials.credentials)
+    
+    try:
+        rows = bulk_update(session, Product, request.ids, request.where, request.values)
+        bump_version(session, CATALOG)
+        rankings_version = bump_version(session, RANKINGS)
+        product_ids = [row["id"] for row in rows]
+        ranked = ranking_rows(session, product_ids)
+        # Products whose text, brand or subcategory changed get new neighbours
+        edited = related_rows(session, product_ids) if set(RELATED_COLUMNS) & set(request.values) else []
+        session.commit()
+        ranking_index.upsert(rankings_version, ranked)
+        await run_in_threadpool(related_index.add_many, edited)
+        return {"updated": rows}
+    except HTTPException:
+        session.rollback()
+        raise
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Update conflicts with a constraint (e.g. an unknown foreign key)")
+    except Exception as e:
+        session.rollback()
+        logger.exception("Error bulk updating products")
+        raise HTTPException(status_code=500, detail=f"Error updating products: {str(e)}")
+
+
+
+@app.delete("/products/auth/bulk")
+async def bulk_delete_products_auth(
+    request: BulkDelete,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    session: Session = Depends(get_session)
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    verify_token(credentials.credentials)
+    
+    try:
+        result, product_ids = bulk_delete(session, Product, request.ids, request.where, request.cascade)
+        bump_version(session, CATALOG)
+        rankings_version = bump_version(session, RANKINGS) if product_ids else None
+        session.commit()
+        if product_ids:
+            ranking_index.remove(rankings_version, product_ids)
+        related_index.remove(product_ids)
+        return result
+    except HTTPException:
+        session.rollback()
+        raise
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Rows were referenced by a concurrent write; retry the request")
+    except Exception as e:
+        session.rollback()
+        logger.exception("Error bulk deleting products")
+        raise HTTPException(status_code=500, detail=f"Error deleting products: {str(e)}")
+
+
+
+# Ratings
+@app.post("/api/products/{product_id}/ratings", status_code=202)
+async def add_rating(
+    product_id: int,
+    rating: RatingCreate,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    session: Session = Depends(get_session)
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    payload = verify_token(credentials.credentials)
+    
+    # Votes are appended to the ratings table and folded into the product's
+    # rating_value/rating_count in the background, so they show up there
+    # after the next fold rather than immediately.
+    try:
+        rating_id = insert_rating(session, product_id, rating.value, payload.get("sub"))
+        return {"ok": True, "id": rating_id}
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=404, detail=f"Product with id {product_id} not found")
+    except Exception as e:
+        session.rollback()
+        logger.exception("Error creating rating")
+        raise HTTPException(status_code=500, detail=f"Error creating rating: {str(e)}")
+
+
+
+# Inventory and reservations
+@app.get("/api/inventory/{product_id}")
+async def get_inventory(product_id: int, db: Session = Depends(get_session)):
+    try:
+        return {"product_id": product_id, "available": get_stock(db, product_id)}
+    except Exception as e:
+        logger.exception("Error in get_inventory")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+
+@app.put("/inventory/auth/{product_id}")
+async def update_inventory_auth(
+    product_id: int,
+    stock: StockUpdate,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    session: Session = Depends(get_session)
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    verify_token(credentials.credentials)
+    
+    if not session.get(Product, product_id):
+        raise HTTPException(status_code=404, detail=f"Product with id {product_id} not found")
+    try:
+        available = set_stock(session, product_id, stock.quantity, stock.shards)
+        return {"product_id": product_id, "quantity": stock.quantity, "available": available, "shards": stock.shards}
+    except HTTPException:
+        raise
+    except Exception as e:
+        session.rollback()
+        logger.exception("Error updating inventory")
+        raise HTTPException(status_code=500, detail=f"Error updating inventory: {str(e)}")
+
+
+
+@app.post("/api/reservations", status_code=201)
+async def create_reservation(
+    reservation: ReservationCreate,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    session: Session = Depends(get_session)
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    payload = verify_token(credentials.credentials)
+    
+    try:
+        held = reserve(
+            session, reservation.product_id, reservation.quantity,
+            reservation.cart_id, payload.get("sub")
+        )
+    except Exception as e:
+        session.rollback()
+        logger.exception("Error creating reservation")
+        raise HTTPException(status_code=500, detail=f"Error creating reservation: {str(e)}")
+    if held is None:
+        raise HTTPException(status_code=409, detail=f"Insufficient stock for product {reservation.product_id}")
+    return held
+
+
+
+@app.post("/api/reservations/{reservation_id}/confirm")
+async def confirm_reservation(
+    reservation_id: int,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    session: Session = Depends(get_session)
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    payload = verify_token(credentials.credentials)
+    
+    try:
+        confirmed = confirm(session, reservation_id, payload.get("sub"))
+    except Exception as e:
+        session.rollback()
+        logger.exception("Error confirming reservation")
+        raise HTTPException(status_code=500, detail=f"Error confirming reservation: {str(e)}")
+    if not confirmed:
+        raise HTTPException(status_code=409, detail=f"Reservation {reservation_id} is not an active hold")
+    return {"ok": True}
+
+
+
+@app.post("/api/reservations/{reservation_id}/release")
+async def release_reservation(
+    reservation_id: int,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    session: Session = Depends(get_session)
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    payload = verify_token(credentials.credentials)
+    
+    try:
+        released = release(session, reservation_id, payload.get("sub"))
+    except Exception as e:
+        session.rollback()
+        logger.exception("Error releasing reservation")
+        raise HTTPException(status_code=500, detail=f"Error releasing reservation: {str(e)}")
+    if not released:
+        raise HTTPException(status_code=409, detail=f"Reservation {reservation_id} is not an active hold")
+    return {"ok": True}
 
 
 
@@ -177,15 +509,79 @@ async def add_category(
         category_data = category.model_dump(exclude={'id'})
         db_category = Category(**category_data)
         session.add(db_category)
+        bump_version(session, CATALOG)
         session.commit()
         session.refresh(db_category)
         return {"message": f"Category Added: {db_category.name}", "category": db_category}
     except Exception as e:
         session.rollback()
+        logger.exception("Error creating category")
         raise HTTPException(status_code=500, detail=f"Error creating category: {str(e)}")
 
 
 
+@app.patch("/categories/auth/bulk")
+async def bulk_update_categories_auth(
+    request: BulkUpdate,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    session: Session = Depends(get_session)
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    verify_token(credentials.credentials)
+    
+    try:
+        rows = bulk_update(session, Category, request.ids, request.where, request.values)
+        bump_version(session, CATALOG)
+        session.commit()
+        return {"updated": rows}
+    except HTTPException:
+        session.rollback()
+        raise
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Update conflicts with a constraint (e.g. an unknown foreign key)")
+    except Exception as e:
+        session.rollback()
+        logger.exception("Error bulk updating categories")
+        raise HTTPException(status_code=500, detail=f"Error updating categories: {str(e)}")
+
+
+
+@app.delete("/categories/auth/bulk")
+async def bulk_delete_categories_auth(
+    request: BulkDelete,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    session: Session = Depends(get_session)
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    verify_token(credentials.credentials)
+    
+    try:
+        result, product_ids = bulk_delete(session, Category, request.ids, request.where, request.cascade)
+        bump_version(session, CATALOG)
+        rankings_version = bump_version(session, RANKINGS) if product_ids else None
+        session.commit()
+        if product_ids:
+            ranking_index.remove(rankings_version, product_ids)
+        related_index.remove(product_ids)
+        return result
+    except HTTPException:
+        session.rollback()
+        raise
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Rows were referenced by a concurrent write; retry the request")
+    except Exception as e:
+        session.rollback()
+        logger.exception("Error bulk deleting categories")
+        raise HTTPException(status_code=500, detail=f"Error deleting categories: {str(e)}")
+
+
+
 @app.put("/categories/auth/{item_id}")
 async def update_category_auth(
     item_id: int,
@@ -204,6 +600,7 @@ async def update_category_auth(
         for key, value in category_data.items():
             setattr(db_category, key, value)
         session.add(db_category)
+        bump_version(session, CATALOG)
         session.commit()
         session.refresh(db_category)
         return db_category
@@ -225,6 +622,7 @@ async def delete_category_auth(
     category = session.get(Category, item_id)
     if category:
         session.delete(category)
+        bump_version(session, CATALOG)
         session.commit()
         return {"ok": True}
     raise HTTPException(status_code=404, detail=f"Category with id {item_id} not found")
@@ -247,15 +645,79 @@ async def add_subcategory(
         subcategory_data = subcategory.model_dump(exclude={'id'})
         db_subcategory = SubCategory(**subcategory_data)
         session.add(db_subcategory)
+        bump_version(session, CATALOG)
         session.commit()
         session.refresh(db_subcategory)
         return {"message": f"SubCategory Added: {db_subcategory.name}", "subcategory": db_subcategory}
     except Exception as e:
         session.rollback()
+        logger.exception("Error creating subcategory")
         raise HTTPException(status_code=500, detail=f"Error creating subcategory: {str(e)}")
 
 
 
+@app.patch("/subcategories/auth/bulk")
+async def bulk_update_subcategories_auth(
+    request: BulkUpdate,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    session: Session = Depends(get_session)
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    verify_token(credentials.credentials)
+    
+    try:
+        rows = bulk_update(session, SubCategory, request.ids, request.where, request.values)
+        bump_version(session, CATALOG)
+        session.commit()
+        return {"updated": rows}
+    except HTTPException:
+        session.rollback()
+        raise
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Update conflicts with a constraint (e.g. an unknown foreign key)")
+    except Exception as e:
+        session.rollback()
+        logger.exception("Error bulk updating subcategories")
+        raise HTTPException(status_code=500, detail=f"Error updating subcategories: {str(e)}")
+
+
+
+@app.delete("/subcategories/auth/bulk")
+async def bulk_delete_subcategories_auth(
+    request: BulkDelete,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    session: Session = Depends(get_session)
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    verify_token(credentials.credentials)
+    
+    try:
+        result, product_ids = bulk_delete(session, SubCategory, request.ids, request.where, request.cascade)
+        bump_version(session, CATALOG)
+        rankings_version = bump_version(session, RANKINGS) if product_ids else None
+        session.commit()
+        if product_ids:
+            ranking_index.remove(rankings_version, product_ids)
+        related_index.remove(product_ids)
+        return result
+    except HTTPException:
+        session.rollback()
+        raise
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Rows were referenced by a concurrent write; retry the request")
+    except Exception as e:
+        session.rollback()
+        logger.exception("Error bulk deleting subcategories")
+        raise HTTPException(status_code=500, detail=f"Error deleting subcategories: {str(e)}")
+
+
+
 @app.put("/subcategories/auth/{item_id}")
 async def update_subcategory_auth(
     item_id: int,
@@ -274,6 +736,7 @@ async def update_subcategory_auth(
         for key, value in subcategory_data.items():
             setattr(db_subcategory, key, value)
         session.add(db_subcategory)
+        bump_version(session, CATALOG)
         session.commit()
         session.refresh(db_subcategory)
         return db_subcategory
@@ -295,6 +758,7 @@ async def delete_subcategory_auth(
     subcategory = session.get(SubCategory, item_id)
     if subcategory:
         session.delete(subcategory)
+        bump_version(session, CATALOG)
         session.commit()
         return {"ok": True}
     raise HTTPException(status_code=404, detail=f"SubCategory with id {item_id} not found")
@@ -322,10 +786,72 @@ async def add_brand(
         return {"message": f"Brand Added: {db_brand.name}", "brand": db_brand}
     except Exception as e:
         session.rollback()
+        logger.exception("Error creating brand")
         raise HTTPException(status_code=500, detail=f"Error creating brand: {str(e)}")
 
 
 
+@app.patch("/brands/auth/bulk")
+async def bulk_update_brands_auth(
+    request: BulkUpdate,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    session: Session = Depends(get_session)
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    verify_token(credentials.credentials)
+    
+    try:
+        rows = bulk_update(session, Brand, request.ids, request.where, request.values)
+        session.commit()
+        return {"updated": rows}
+    except HTTPException:
+        session.rollback()
+        raise
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Update conflicts with a constraint (e.g. an unknown foreign key)")
+    except Exception as e:
+        session.rollback()
+        logger.exception("Error bulk updating brands")
+        raise HTTPException(status_code=500, detail=f"Error updating brands: {str(e)}")
+
+
+
+@app.delete("/brands/auth/bulk")
+async def bulk_delete_brands_auth(
+    request: BulkDelete,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())],
+    session: Session = Depends(get_session)
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    verify_token(credentials.credentials)
+    
+    try:
+        result, product_ids = bulk_delete(session, Brand, request.ids, request.where, request.cascade)
+        bump_version(session, CATALOG)
+        rankings_version = bump_version(session, RANKINGS) if product_ids else None
+        session.commit()
+        if product_ids:
+            ranking_index.remove(rankings_version, product_ids)
+        related_index.remove(product_ids)
+        return result
+    except HTTPException:
+        session.rollback()
+        raise
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="Rows were referenced by a concurrent write; retry the request")
+    except Exception as e:
+        session.rollback()
+        logger.exception("Error bulk deleting brands")
+        raise HTTPException(status_code=500, detail=f"Error deleting brands: {str(e)}")
+
+
+
 @app.put("/brands/auth/{item_id}")
 async def update_brand_auth(
     item_id: int,
@@ -371,10 +897,152 @@ async def delete_brand_auth(
 
 
 
+# Admin profiling
+@app.post("/admin/profiling")
+async def enable_profiling(
+    settings: ProfilingRequest,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())]
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    verify_token(credentials.credentials)
+    
+    profiling_control.enable(settings.requests, settings.sample_rate, settings.path_prefix)
+    return profiling_control.status()
+
+
+
+@app.get("/admin/profiling")
+async def get_profiling_status(
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())]
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    verify_token(credentials.credentials)
+    
+    return profiling_control.status()
+
+
+
+@app.delete("/admin/profiling")
+async def disable_profiling(
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())]
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    verify_token(credentials.credentials)
+    
+    profiling_control.disable()
+    return profiling_control.status()
+
+
+
+@app.get("/admin/profiles")
+async def get_profiles(
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())]
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    verify_token(credentials.credentials)
+    
+    return {"profiles": list_profiles()}
+
+
+
+@app.get("/admin/profiles/{name}")
+async def download_profile(
+    name: str,
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(HTTPBearer())]
+):
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    
+    verify_token(credentials.credentials)
+    
+    path = profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile {name} not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
+
+
+
 # Initialize database
 @app.on_event("startup")
 async def on_startup():
     init_db()
+    threading.Thread(target=_load_related_index, name="related-index", daemon=True).start()
+    app.state.related_syncer = asyncio.create_task(_sync_related_index_periodically())
+    app.state.rating_folder = asyncio.create_task(_fold_ratings_periodically())
+    app.state.reservation_sweeper = asyncio.create_task(_expire_reservations_periodically())
+
+def _load_related_index():
+    try:
+        with Session(engine) as session:
+            load_related_index(session)
+    except Exception:
+        logger.exception("Error loading related products index")
+
+def _sync_related_index():
+    # Until the startup load finishes there is nothing to fold into
+    if not related_index.ready:
+        return
+    with Session(engine) as session:
+        changed = sync_related_index(session)
+    if changed:
+        logger.info("Synced related products index", extra={"products": changed})
+
+async def _sync_related_index_periodically():
+    while True:
+        await asyncio.sleep(RELATED_SYNC_INTERVAL)
+        try:
+            await run_in_threadpool(_sync_related_index)
+        except Exception:
+            logger.exception("Error syncing related products index")
+
+def _fold_ratings():
+    with Session(engine) as session:
+        while True:
+            result = fold_ratings(session)
+            if result["ratings"]:
+                ranking_index.upsert(result["version"], result["products"])
+                logger.info("Folded ratings", extra={"ratings": result["ratings"], "products": len(result["products"])})
+            if result["ratings"] < RATING_FOLD_BATCH:
+                return
+
+async def _fold_ratings_periodically():
+    while True:
+        await asyncio.sleep(RATING_FOLD_INTERVAL)
+        try:
+            await run_in_threadpool(_fold_ratings)
+        except Exception:
+            logger.exception("Error folding ratings")
+
+def _expire_reservations():
+    with Session(engine) as session:
+        while True:
+            expired = expire_reservations(session)
+            if expired:
+                logger.info("Expired reservations", extra={"reservations": expired})
+            if expired < SWEEP_BATCH_SIZE:
+                return
+
+async def _expire_reservations_periodically():
+    while True:
+        await asyncio.sleep(INVENTORY_SWEEP_INTERVAL)
+        try:
+            await run_in_threadpool(_expire_reservations)
+        except Exception:
+            logger.exception("Error expiring reservations")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    app.state.related_syncer.cancel()
+    app.state.rating_folder.cancel()
+    app.state.reservation_sweeper.cancel()
 
 # Run the app
 if __name__ == "__main__":
@@ -9,9 +9,12 @@ from models.categories import Category
 from models.subcategories import SubCategory
 from models.products import Product
 from models.brands import Brand
+from models.ratings import Rating, PendingRating, RatingFold
+from models.inventory import StockShard, Reservation
+from models.versions import CacheVersion
 
 # Register models to ensure they are picked up by SQLModel metadata
-models = [Category, SubCategory, Product, Brand]  # Updated to include Brand
+models = [Category, SubCategory, Product, Brand, Rating, PendingRating, RatingFold, StockShard, Reservation, CacheVersion]
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,63 @@
+"""add ratings, pending_ratings, rating_folds and products.rating_sum
+
+Revision ID: 4b8e2d71c6a9
+Revises: 1851a3fae022
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b8e2d71c6a9'
+down_revision: Union[str, None] = '1851a3fae022'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('rating_folds',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ratings', sa.Integer(), nullable=False),
+    sa.Column('products', sa.Integer(), nullable=False),
+    sa.Column('last_rating_id', sa.Integer(), nullable=True),
+    sa.Column('folded_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_rating_folds_id'), 'rating_folds', ['id'], unique=False)
+    
+    op.create_table('ratings',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ratings_id'), 'ratings', ['id'], unique=False)
+    op.create_index(op.f('ix_ratings_product_id'), 'ratings', ['product_id'], unique=False)
+    
+    op.create_table('pending_ratings',
+    sa.Column('rating_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['rating_id'], ['ratings.id'], ),
+    sa.PrimaryKeyConstraint('rating_id')
+    )
+    
+    op.add_column('products', sa.Column('rating_sum', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('products', 'rating_sum')
+    op.drop_table('pending_ratings')
+    op.drop_index(op.f('ix_ratings_product_id'), table_name='ratings')
+    op.drop_index(op.f('ix_ratings_id'), table_name='ratings')
+    op.drop_table('ratings')
+    op.drop_index(op.f('ix_rating_folds_id'), table_name='rating_folds')
+    op.drop_table('rating_folds')
@@ -0,0 +1,36 @@
+"""add cache_versions
+
+Revision ID: 5c0a9e4f7b21
+Revises: e71f09b3d52c
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c0a9e4f7b21'
+down_revision: Union[str, None] = 'e71f09b3d52c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    cache_versions = op.create_table('cache_versions',
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    
+    op.bulk_insert(cache_versions, [
+        {'name': 'catalog', 'version': 0},
+        {'name': 'rankings', 'version': 0},
+    ])
+
+
+def downgrade() -> None:
+    op.drop_table('cache_versions')
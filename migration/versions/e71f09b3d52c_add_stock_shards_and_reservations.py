@@ -0,0 +1,56 @@
+"""add stock_shards and reservations
+
+Revision ID: e71f09b3d52c
+Revises: 4b8e2d71c6a9
+Create Date: 2026-10-19 10:25:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e71f09b3d52c'
+down_revision: Union[str, None] = '4b8e2d71c6a9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('stock_shards',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('available', sa.Integer(), nullable=False),
+    sa.CheckConstraint('available >= 0', name='ck_stock_shards_available'),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('product_id', 'shard')
+    )
+    
+    op.create_table('reservations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('status', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('cart_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('user_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_reservations_id'), 'reservations', ['id'], unique=False)
+    op.create_index(op.f('ix_reservations_product_id'), 'reservations', ['product_id'], unique=False)
+    op.create_index('ix_reservations_held_expires_at', 'reservations', ['expires_at'], unique=False,
+                    postgresql_where=sa.text("status = 'held'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_reservations_held_expires_at', table_name='reservations')
+    op.drop_index(op.f('ix_reservations_product_id'), table_name='reservations')
+    op.drop_index(op.f('ix_reservations_id'), table_name='reservations')
+    op.drop_table('reservations')
+    op.drop_table('stock_shards')
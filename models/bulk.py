@@ -0,0 +1,14 @@
+from sqlmodel import Field, SQLModel
+from typing import Any, Optional
+
+
+class BulkUpdate(SQLModel):
+    ids: Optional[list[int]] = None
+    where: dict[str, Any] = Field(default_factory=dict)
+    values: dict[str, Any]
+
+
+class BulkDelete(SQLModel):
+    ids: Optional[list[int]] = None
+    where: dict[str, Any] = Field(default_factory=dict)
+    cascade: bool = False
@@ -0,0 +1,47 @@
+from datetime import datetime
+from sqlalchemy import CheckConstraint, DateTime, Index, text
+from sqlmodel import Field, SQLModel
+from typing import Optional
+from .base import Base
+from .ratings import utcnow
+
+
+# A slice of a product's stock. Hot products get several shards so concurrent
+# checkouts lock different rows.
+class StockShard(SQLModel, table=True):
+    __tablename__ = "stock_shards"
+    __table_args__ = (
+        CheckConstraint("available >= 0", name="ck_stock_shards_available"),
+    )
+    
+    product_id: int = Field(foreign_key="products.id", primary_key=True)
+    shard: int = Field(primary_key=True)
+    available: int = Field(default=0)
+
+
+class Reservation(Base, table=True):
+    __tablename__ = "reservations"
+    __table_args__ = (
+        # Only live holds are scanned by the expiry sweeper
+        Index("ix_reservations_held_expires_at", "expires_at", postgresql_where=text("status = 'held'")),
+    )
+    
+    product_id: int = Field(foreign_key="products.id", index=True)
+    shard: int
+    quantity: int
+    status: str = Field(default="held")  # held, confirmed, released, expired
+    cart_id: Optional[str] = None
+    user_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=utcnow, sa_type=DateTime(timezone=True))
+    expires_at: datetime = Field(sa_type=DateTime(timezone=True))
+
+
+class StockUpdate(SQLModel):
+    quantity: int = Field(ge=0)
+    shards: int = Field(default=1, ge=1, le=64)
+
+
+class ReservationCreate(SQLModel):
+    product_id: int
+    quantity: int = Field(default=1, ge=1)
+    cart_id: Optional[str] = None
@@ -13,4 +13,6 @@ class Product(Base, table=True):
     subcategory_id: int = Field(foreign_key="subcategories.id")
     image_url: Optional[str] = None
     rating_value: int = Field(default=39)
-    rating_count: int = Field(default=120)
\ No newline at end of file
+    rating_count: int = Field(default=120)
+    # Exact total behind rating_value (same units); NULL means rating_value * rating_count
+    rating_sum: Optional[int] = None
\ No newline at end of file
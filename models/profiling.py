@@ -0,0 +1,8 @@
+from sqlmodel import Field, SQLModel
+from typing import Optional
+
+
+class ProfilingRequest(SQLModel):
+    requests: int = Field(default=0, ge=0)
+    sample_rate: float = Field(default=0.0, ge=0.0, le=1.0)
+    path_prefix: Optional[str] = None
@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+from sqlalchemy import DateTime
+from sqlmodel import Field, SQLModel
+from typing import Optional
+from .base import Base
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+class Rating(Base, table=True):
+    __tablename__ = "ratings"
+    
+    product_id: int = Field(foreign_key="products.id", index=True)
+    user_id: Optional[str] = None
+    value: int
+    created_at: datetime = Field(default_factory=utcnow, sa_type=DateTime(timezone=True))
+
+
+# Votes not folded into their product yet. Written in the same transaction as
+# the vote and deleted by the fold that applies it, so ratings itself is
+# insert-only and this table only ever holds the backlog.
+class PendingRating(SQLModel, table=True):
+    __tablename__ = "pending_ratings"
+    
+    rating_id: int = Field(foreign_key="ratings.id", primary_key=True)
+    product_id: int
+    value: int
+
+
+class RatingFold(Base, table=True):
+    __tablename__ = "rating_folds"
+    
+    ratings: int
+    products: int
+    # Highest rating id applied by this fold
+    last_rating_id: Optional[int] = None
+    folded_at: datetime = Field(default_factory=utcnow, sa_type=DateTime(timezone=True))
+
+
+class RatingCreate(SQLModel):
+    value: int = Field(ge=1, le=5)
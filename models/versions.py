@@ -0,0 +1,11 @@
+from sqlmodel import Field, SQLModel
+
+
+# One row per cached view. Write handlers bump the row in the same
+# transaction as their change, so every process sees the new version as soon
+# as the change itself is visible.
+class CacheVersion(SQLModel, table=True):
+    __tablename__ = "cache_versions"
+    
+    name: str = Field(primary_key=True)
+    version: int = Field(default=0)
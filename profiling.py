@@ -0,0 +1,224 @@
+import asyncio
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+from config import PROFILE_DIR, PROFILE_INTERVAL, PROFILE_KEEP
+from log import request_id_var
+
+
+# Set by the profiling middleware; inherited by every task the request spawns
+profiled_request: ContextVar[object] = ContextVar("profiled_request", default=None)
+
+# Task.get_context() (3.12+) lets the sampler tell which request is running
+PER_REQUEST = hasattr(asyncio.Task, "get_context")
+
+# Stand-in stack for ticks where the profiled request isn't running on the loop
+WAITING_STACK = "(waiting: awaiting I/O, the threadpool or other requests)"
+
+
+class SamplingProfiler:
+    """Periodically samples the event loop thread's stack from a background thread.
+
+    A tick is attributed to the profiled request only when the loop's current
+    task carries the request's `profiled_request` token. Ticks spent running
+    other requests, or idle while this one awaits, are counted under
+    WAITING_STACK so the wall profile still adds up to the request's
+    duration. On Pythons without Task.get_context() samples can't be
+    filtered and the profile covers the whole loop (`per_request` is False).
+
+    A tick also counts as a CPU sample when the thread's CPU clock advanced
+    since the previous tick, so time spent waiting on the database shows up
+    in the wall profile only.
+    """
+
+    def __init__(self, thread_id: int, loop: asyncio.AbstractEventLoop, token: object,
+                 interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.loop = loop
+        self.token = token
+        self.interval = interval
+        self.per_request = PER_REQUEST
+        self.wall = Counter()
+        self.cpu = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        try:
+            self._cpu_clock = time.pthread_getcpuclockid(thread_id)
+        except (AttributeError, OSError):
+            self._cpu_clock = None
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _cpu_time(self):
+        if self._cpu_clock is None:
+            return None
+        try:
+            return time.clock_gettime(self._cpu_clock)
+        except OSError:
+            return None
+
+    def _is_profiled_task(self) -> bool:
+        if not self.per_request:
+            return True
+        task = asyncio.current_task(self.loop)
+        return task is not None and task.get_context().get(profiled_request) is self.token
+
+    def _run(self):
+        last_cpu = self._cpu_time()
+        while not self._stop.wait(self.interval):
+            ours = self._is_profiled_task()
+            frame = sys._current_frames().get(self.thread_id)
+            cpu = self._cpu_time()
+            if ours and frame is not None:
+                stack = collapse_stack(frame)
+                self.wall[stack] += 1
+                if cpu is not None and last_cpu is not None and cpu > last_cpu:
+                    self.cpu[stack] += 1
+            else:
+                self.wall[WAITING_STACK] += 1
+            last_cpu = cpu
+
+
+def collapse_stack(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_qualname} ({Path(code.co_filename).name}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class ProfilingControl:
+    """Decides which requests get profiled.
+
+    While `active` is False, ProfilingMiddleware hands each request straight
+    to the app without checking anything else.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.remaining = 0
+        self.sample_rate = 0.0
+        self.path_prefix = None
+        self._lock = threading.Lock()
+
+    def enable(self, requests: int = 0, sample_rate: float = 0.0, path_prefix: str = None):
+        with self._lock:
+            self.remaining = requests
+            self.sample_rate = sample_rate
+            self.path_prefix = path_prefix
+            self.active = requests > 0 or sample_rate > 0
+
+    def disable(self):
+        with self._lock:
+            self.active = False
+            self.remaining = 0
+            self.sample_rate = 0.0
+            self.path_prefix = None
+
+    def should_profile(self, path: str) -> bool:
+        if self.path_prefix and not path.startswith(self.path_prefix):
+            return False
+        with self._lock:
+            if self.remaining > 0:
+                self.remaining -= 1
+                if self.remaining == 0 and self.sample_rate <= 0:
+                    self.active = False
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def status(self) -> dict:
+        return {
+            "active": self.active,
+            "remaining": self.remaining,
+            "sample_rate": self.sample_rate,
+            "path_prefix": self.path_prefix,
+        }
+
+
+profiling_control = ProfilingControl()
+
+
+class ProfilingMiddleware:
+    """Profile the requests profiling_control picks.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so requests that aren't
+    profiled go to the app with no extra task or response wrapping.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not profiling_control.active:
+            return await self.app(scope, receive, send)
+        if scope["type"] != "http" or not profiling_control.should_profile(scope["path"]):
+            return await self.app(scope, receive, send)
+        # Handlers and their database calls run on the event loop thread, so
+        # sampling it captures SQL time as well as Python time. The token marks
+        # this request's tasks so samples from concurrent requests are left out.
+        token = object()
+        context_token = profiled_request.set(token)
+        profiler = SamplingProfiler(threading.get_ident(), asyncio.get_running_loop(), token)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+            profiled_request.reset(context_token)
+            await run_in_threadpool(
+                save_profile, profiler, scope["method"], scope["path"], request_id_var.get()
+            )
+
+
+def _profile_dir() -> Path:
+    path = Path(PROFILE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def save_profile(profiler: SamplingProfiler, method: str, path: str, request_id: str) -> list[str]:
+    """Write wall and CPU stacks in collapsed (flamegraph.pl / speedscope) format."""
+    directory = _profile_dir()
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+    request_id = re.sub(r"[^A-Za-z0-9]+", "", request_id)[:32]
+    # Unfiltered profiles include other requests; say so in the file name
+    scope = "" if profiler.per_request else ".loop"
+    names = []
+    for kind, samples in (("wall", profiler.wall), ("cpu", profiler.cpu)):
+        name = f"{stamp}-{method.lower()}-{slug}-{request_id}{scope}.{kind}.folded"
+        with open(directory / name, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        names.append(name)
+
+    profiles = sorted(directory.glob("*.folded"))
+    for old in profiles[:max(len(profiles) - PROFILE_KEEP, 0)]:
+        old.unlink(missing_ok=True)
+    return names
+
+
+def list_profiles() -> list[str]:
+    return sorted((p.name for p in _profile_dir().glob("*.folded")), reverse=True)
+
+
+def profile_path(name: str) -> Path | None:
+    # Only hand out files that are actually in the profile directory
+    if name not in list_profiles():
+        return None
+    return _profile_dir() / name
@@ -0,0 +1,146 @@
+import threading
+from bisect import bisect_left, insort
+
+from sqlalchemy import select
+from sqlmodel import Session
+
+from bulk import BATCH_SIZE
+from config import RANKING_PRIOR_WEIGHT
+from models.products import Product
+
+
+SORTS = ("top_rated", "popular")
+
+# Everything a product's rankings depend on, in RankingIndex.upsert() order
+RANKED_COLUMNS = (
+    Product.id, Product.category_id, Product.subcategory_id,
+    Product.rating_value, Product.rating_count,
+)
+
+
+def bayesian_score(rating_value: float, rating_count: int, prior_mean: float,
+                   prior_weight: int = RANKING_PRIOR_WEIGHT) -> float:
+    """Average rating pulled towards the catalog mean until a product has enough votes."""
+    return (prior_weight * prior_mean + rating_value * rating_count) / (prior_weight + rating_count)
+
+
+class RankingIndex:
+    """Per-category and per-subcategory product rankings kept in sorted lists.
+
+    Each list holds (-score, product_id) in ascending order, so the top K of a
+    scope is the first K entries. `popular` ranks by rating_count, the closest
+    thing to sales volume the catalog records.
+
+    The prior mean used by `top_rated` is fixed when the index is built;
+    incremental updates reuse it until the next rebuild.
+
+    The index is tagged with the RANKINGS version (see versions.py) it
+    reflects. Writers bump that version in their transaction and then pass
+    it to upsert()/remove(); the change is applied in place when it is the
+    next version, so this process's writes never cost a rebuild. A gap
+    means another process wrote in between, and leaves the index stale
+    until the next request rebuilds it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held for the whole of a rebuild so concurrent requests don't repeat it
+        self._build_lock = threading.Lock()
+        self._built = False
+        self._version = None
+        self._prior_mean = 0.0
+        # product_id -> (scope keys, {sort: sort key})
+        self._entries = {}
+        # (sort, scope, scope_id) -> sorted [(-score, product_id)]
+        self._lists = {}
+
+    def is_current(self, version: int) -> bool:
+        return self._built and self._version == version
+
+    def rebuild(self, session: Session, version: int):
+        """Reload every product; `version` must have been read before this call."""
+        with self._build_lock:
+            if self.is_current(version):
+                return
+            rows = session.exec(select(*RANKED_COLUMNS)).all()
+            votes = sum(row.rating_count for row in rows)
+            prior_mean = sum(row.rating_value * row.rating_count for row in rows) / votes if votes else 0.0
+            with self._lock:
+                # Local writes may have moved the index past `version` meanwhile
+                if self._built and self._version > version:
+                    return
+                self._prior_mean = prior_mean
+                self._entries = {}
+                self._lists = {}
+                for row in rows:
+                    self._insert(*row)
+                self._version = version
+                self._built = True
+
+    def _advance(self, version: int) -> bool:
+        """Whether a write tagged `version` should be applied; call with _lock held."""
+        if not self._built or version != self._version + 1:
+            return False
+        self._version = version
+        return True
+
+    def upsert(self, version: int, products):
+        """Apply (id, category_id, subcategory_id, rating_value, rating_count) rows."""
+        with self._lock:
+            if not self._advance(version):
+                return
+            for product in products:
+                self._remove(product[0])
+                self._insert(*product)
+
+    def remove(self, version: int, product_ids):
+        with self._lock:
+            if not self._advance(version):
+                return
+            for product_id in product_ids:
+                self._remove(product_id)
+
+    def top(self, sort: str, category_id: int = None, subcategory_id: int = None, k: int = 10) -> list:
+        if subcategory_id is not None:
+            key = (sort, "subcategory", subcategory_id)
+        elif category_id is not None:
+            key = (sort, "category", category_id)
+        else:
+            key = (sort, "all", None)
+        with self._lock:
+            return [(product_id, -score) for score, product_id in self._lists.get(key, [])[:k]]
+
+    def _insert(self, product_id, category_id, subcategory_id, rating_value, rating_count):
+        scopes = [("all", None), ("category", category_id), ("subcategory", subcategory_id)]
+        sort_keys = {
+            "top_rated": -bayesian_score(rating_value, rating_count, self._prior_mean),
+            "popular": -rating_count,
+        }
+        self._entries[product_id] = (scopes, sort_keys)
+        for sort, sort_key in sort_keys.items():
+            for scope in scopes:
+                insort(self._lists.setdefault((sort, *scope), []), (sort_key, product_id))
+
+    def _remove(self, product_id):
+        entry = self._entries.pop(product_id, None)
+        if entry is None:
+            return
+        scopes, sort_keys = entry
+        for sort, sort_key in sort_keys.items():
+            for scope in scopes:
+                ranked = self._lists[(sort, *scope)]
+                i = bisect_left(ranked, (sort_key, product_id))
+                if i < len(ranked) and ranked[i][1] == product_id:
+                    del ranked[i]
+
+
+ranking_index = RankingIndex()
+
+
+def ranking_rows(session: Session, product_ids: list[int]) -> list:
+    """RANKED_COLUMNS for the given products, to pass to RankingIndex.upsert()."""
+    rows = []
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+        rows.extend(session.exec(select(*RANKED_COLUMNS).where(Product.id.in_(batch))).all())
+    return rows
@@ -0,0 +1,91 @@
+from sqlalchemy import Float, cast, delete, func, insert, select, update
+from sqlmodel import Session
+
+from config import RATING_FOLD_BATCH
+from models.products import Product
+from models.ratings import PendingRating, Rating, RatingFold, utcnow
+from versions import RANKINGS, bump_version
+
+
+# products.rating_value stores the average star rating times ten (39 == 3.9)
+RATING_SCALE = 10
+
+# pg advisory lock key so only one process folds at a time
+FOLD_LOCK_ID = 4207
+
+
+def insert_rating(session: Session, product_id: int, value: int, user_id: str = None) -> int:
+    """Append one vote and queue it for the next fold. Never touches the products row."""
+    stmt = insert(Rating).values(
+        product_id=product_id, value=value, user_id=user_id, created_at=utcnow()
+    ).returning(Rating.id)
+    rating_id = session.exec(stmt).scalar_one()
+    session.exec(insert(PendingRating).values(rating_id=rating_id, product_id=product_id, value=value))
+    session.commit()
+    return rating_id
+
+
+def fold_ratings(session: Session, limit: int = RATING_FOLD_BATCH) -> dict:
+    """Fold up to `limit` queued votes into the product aggregates.
+
+    The oldest pending_ratings rows are claimed by id, all products with
+    claimed votes are updated by one UPDATE ... FROM (grouped votes)
+    statement, and the claimed rows are deleted, in one transaction. Votes
+    whose insert hasn't committed yet aren't visible to the claim and stay
+    queued for a later fold, so none are skipped whatever order ids commit
+    in, and the ratings table itself is never updated.
+
+    The running total is kept exactly in rating_sum and rating_value is
+    derived from it, so single votes aren't lost to rounding. The RANKINGS
+    version is bumped in the same transaction and returned with the
+    products, ready for ranking_index.upsert().
+    """
+    empty = {"fold_id": None, "ratings": 0, "rating_ids": [], "products": [], "version": None}
+    if session.get_bind().dialect.name == "postgresql":
+        locked = session.exec(select(func.pg_try_advisory_xact_lock(FOLD_LOCK_ID))).scalar_one()
+        if not locked:
+            session.rollback()
+            return empty
+
+    # An explicit id list rather than an id range: a lower id committing
+    # mid-fold must not be deleted without being applied
+    rating_ids = session.exec(
+        select(PendingRating.rating_id).order_by(PendingRating.rating_id).limit(limit)
+    ).scalars().all()
+    if not rating_ids:
+        session.rollback()
+        return empty
+
+    batch = select(
+        PendingRating.product_id,
+        func.count().label("votes"),
+        func.sum(PendingRating.value).label("total"),
+    ).where(PendingRating.rating_id.in_(rating_ids)).group_by(PendingRating.product_id).subquery()
+    rating_sum = (
+        func.coalesce(Product.rating_sum, Product.rating_value * Product.rating_count)
+        + batch.c.total * RATING_SCALE
+    )
+    rating_count = Product.rating_count + batch.c.votes
+    stmt = update(Product).where(Product.id == batch.c.product_id).values(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating_value=func.round(cast(rating_sum, Float) / rating_count),
+    ).returning(
+        Product.id, Product.category_id, Product.subcategory_id, Product.rating_value, Product.rating_count
+    )
+    products = session.exec(stmt, execution_options={"synchronize_session": False}).all()
+    session.exec(
+        delete(PendingRating).where(PendingRating.rating_id.in_(rating_ids)),
+        execution_options={"synchronize_session": False},
+    )
+
+    fold = RatingFold(ratings=len(rating_ids), products=len(products), last_rating_id=rating_ids[-1])
+    session.add(fold)
+    session.flush()
+    fold_id = fold.id
+    version = bump_version(session, RANKINGS)
+    session.commit()
+    return {
+        "fold_id": fold_id, "ratings": len(rating_ids), "rating_ids": rating_ids,
+        "products": products, "version": version,
+    }
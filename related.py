@@ -0,0 +1,377 @@
+import logging
+import re
+import threading
+import zlib
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import select
+from sqlmodel import Session
+
+from config import RELATED_INDEX_PATH, RELATED_TOP_N
+from models.products import Product
+from versions import CATALOG, current_version
+
+
+logger = logging.getLogger(__name__)
+
+# Hashed feature space: TF-IDF over name/description tokens, plus a small
+# block for brand and subcategory so items from the same line sort together.
+TEXT_DIM = 2048
+CATEGORICAL_DIM = 128
+NAME_WEIGHT = 2
+BRAND_WEIGHT = 0.3
+SUBCATEGORY_WEIGHT = 0.5
+BATCH_SIZE = 512
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _bucket(token: str, dim: int) -> int:
+    # crc32 rather than hash() so buckets are stable across processes
+    return zlib.crc32(token.encode("utf-8")) % dim
+
+
+def _term_counts(name: str, description: str) -> dict:
+    counts = {}
+    for text, weight in ((name, NAME_WEIGHT), (description, 1)):
+        for token in _TOKEN_RE.findall((text or "").lower()):
+            if len(token) > 1:
+                bucket = _bucket(token, TEXT_DIM)
+                counts[bucket] = counts.get(bucket, 0) + weight
+    return counts
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+class RelatedIndex:
+    """Top-N similar products for every product, precomputed with NumPy.
+
+    `neighbours[row]` holds product ids ordered by cosine similarity, so a
+    lookup is a dict hit plus a slice. New products are folded in with one
+    matrix-vector product against the existing vectors; document frequencies
+    for existing products are only refreshed by a full rebuild.
+    """
+
+    def __init__(self, top_n: int = RELATED_TOP_N):
+        self.top_n = top_n
+        self.ready = False
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._size = 0
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._vectors = np.zeros((0, TEXT_DIM + CATEGORICAL_DIM), dtype=np.float32)
+        self._neighbours = np.zeros((0, top_n), dtype=np.int64)
+        self._scores = np.zeros((0, top_n), dtype=np.float32)
+        self._df = np.zeros(TEXT_DIM, dtype=np.float32)
+        self._docs = 0
+
+    # Vectorizing
+
+    def _idf(self) -> np.ndarray:
+        return np.log((1 + self._docs) / (1 + self._df)) + 1
+
+    def _vectorize(self, term_counts: list, brand_ids, subcategory_ids, idf: np.ndarray = None) -> np.ndarray:
+        n = len(term_counts)
+        text = np.zeros((n, TEXT_DIM), dtype=np.float32)
+        for row, counts in enumerate(term_counts):
+            if counts:
+                text[row, list(counts)] = list(counts.values())
+        text = _normalize(text * (self._idf() if idf is None else idf))
+
+        categorical = np.zeros((n, CATEGORICAL_DIM), dtype=np.float32)
+        rows = np.arange(n)
+        brand_buckets = [_bucket(f"brand:{brand_id}", CATEGORICAL_DIM) for brand_id in brand_ids]
+        subcategory_buckets = [_bucket(f"subcategory:{subcategory_id}", CATEGORICAL_DIM) for subcategory_id in subcategory_ids]
+        np.add.at(categorical, (rows, brand_buckets), BRAND_WEIGHT)
+        np.add.at(categorical, (rows, subcategory_buckets), SUBCATEGORY_WEIGHT)
+
+        return _normalize(np.hstack([text, categorical])).astype(np.float32)
+
+    # Building
+
+    def build(self, products: list):
+        """Rebuild from (id, name, description, brand_id, subcategory_id) tuples."""
+        ids = np.array([p[0] for p in products], dtype=np.int64)
+        term_counts = [_term_counts(p[1], p[2]) for p in products]
+        df = np.zeros(TEXT_DIM, dtype=np.float32)
+        for counts in term_counts:
+            df[list(counts)] += 1
+
+        with self._lock:
+            self._df = df
+            self._docs = len(products)
+        vectors = self._vectorize(term_counts, [p[3] for p in products], [p[4] for p in products])
+        neighbours, scores = self._nearest(vectors, vectors, ids, exclude_self=True)
+
+        with self._lock:
+            self._ids = ids
+            self._vectors = vectors
+            self._size = len(ids)
+            self._neighbours = neighbours
+            self._scores = scores
+            self._rows = {int(product_id): row for row, product_id in enumerate(ids)}
+            self.ready = True
+
+    def _nearest(self, queries: np.ndarray, vectors: np.ndarray, ids: np.ndarray, exclude_self: bool = False):
+        n = len(queries)
+        k = min(self.top_n, max(len(ids) - (1 if exclude_self else 0), 0))
+        neighbours = np.full((n, self.top_n), -1, dtype=np.int64)
+        scores = np.full((n, self.top_n), -np.inf, dtype=np.float32)
+        if k == 0:
+            return neighbours, scores
+        for start in range(0, n, BATCH_SIZE):
+            sims = queries[start:start + BATCH_SIZE] @ vectors.T
+            if exclude_self:
+                batch_rows = np.arange(start, start + len(sims))
+                sims[batch_rows - start, batch_rows] = -np.inf
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            top_sims = np.take_along_axis(sims, top, axis=1)
+            order = np.argsort(-top_sims, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            neighbours[start:start + len(sims), :k] = ids[top]
+            scores[start:start + len(sims), :k] = np.take_along_axis(top_sims, order, axis=1)
+        return neighbours, scores
+
+    # Incremental updates
+
+    def add(self, product_id: int, name: str, description: str, brand_id: int, subcategory_id: int):
+        """Fold a new or edited product in without recomputing the rest of the index.
+
+        The matrix-vector products run against a snapshot taken under the
+        lock, so lookups aren't blocked while they run. Products appended by
+        a concurrent add after the snapshot are compared under the lock.
+
+        An edited product keeps its row. It is dropped from every neighbour
+        list and re-inserted where it now ranks, so lists it falls out of
+        are one entry short until the next full rebuild.
+        """
+        counts = _term_counts(name, description)
+        with self._lock:
+            if not self.ready:
+                return
+            own_row = self._rows.get(product_id)
+            if own_row is None:
+                # Document frequencies of edited products are left to the next rebuild
+                self._df[list(counts)] += 1
+                self._docs += 1
+            idf = self._idf()
+            size = self._size
+            vectors = self._vectors[:size]
+            ids = self._ids[:size]
+
+        vector = self._vectorize([counts], [brand_id], [subcategory_id], idf)[0]
+        sims = vectors @ vector
+        if own_row is not None:
+            sims[own_row] = -np.inf
+        neighbours, scores = self._top(sims, ids)
+
+        with self._lock:
+            if self._rows.get(product_id) != own_row:
+                return
+            if own_row is not None:
+                self._drop_neighbour(product_id)
+            # Existing products whose weakest neighbour is beaten by this one
+            improved = np.nonzero(sims > self._scores[:size, -1])[0]
+            for row in improved:
+                self._insert_neighbour(row, product_id, sims[row])
+
+            for row in range(size, self._size):
+                sim = self._vectors[row] @ vector
+                if sim > self._scores[row, -1]:
+                    self._insert_neighbour(row, product_id, sim)
+                if sim > scores[-1]:
+                    position = np.searchsorted(-scores, -sim)
+                    neighbours = np.insert(neighbours, position, self._ids[row])[:self.top_n]
+                    scores = np.insert(scores, position, sim)[:self.top_n]
+
+            if own_row is None:
+                self._append(product_id, vector, neighbours, scores)
+            else:
+                self._vectors[own_row] = vector
+                self._neighbours[own_row] = neighbours
+                self._scores[own_row] = scores
+
+    def add_many(self, products: list):
+        """add() each (id, name, description, brand_id, subcategory_id) tuple."""
+        for product in products:
+            self.add(*product)
+
+    def _top(self, sims: np.ndarray, ids: np.ndarray):
+        """One product's neighbour row from its similarities to `ids`."""
+        neighbours = np.full(self.top_n, -1, dtype=np.int64)
+        scores = np.full(self.top_n, -np.inf, dtype=np.float32)
+        k = min(self.top_n, int(np.count_nonzero(sims > -np.inf)))
+        if k == 0:
+            return neighbours, scores
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        neighbours[:k] = ids[top]
+        scores[:k] = sims[top]
+        return neighbours, scores
+
+    def _drop_neighbour(self, product_id: int):
+        rows, columns = np.nonzero(self._neighbours[:self._size] == product_id)
+        for row, column in zip(rows, columns):
+            self._neighbours[row, column:-1] = self._neighbours[row, column + 1:].copy()
+            self._scores[row, column:-1] = self._scores[row, column + 1:].copy()
+            self._neighbours[row, -1] = -1
+            self._scores[row, -1] = -np.inf
+
+    def _insert_neighbour(self, row: int, product_id: int, score: float):
+        position = np.searchsorted(-self._scores[row], -score)
+        self._neighbours[row, position + 1:] = self._neighbours[row, position:-1].copy()
+        self._scores[row, position + 1:] = self._scores[row, position:-1].copy()
+        self._neighbours[row, position] = product_id
+        self._scores[row, position] = score
+
+    def _append(self, product_id: int, vector: np.ndarray, neighbours: np.ndarray, scores: np.ndarray):
+        # Grow storage by a quarter at a time: still amortized O(1) copies per
+        # add, with far less spare capacity than doubling on a small VM
+        if self._size == len(self._ids):
+            capacity = max(self._size + self._size // 4, 16)
+            self._ids = np.resize(self._ids, capacity)
+            self._vectors = np.resize(self._vectors, (capacity, self._vectors.shape[1]))
+            self._neighbours = np.resize(self._neighbours, (capacity, self.top_n))
+            self._scores = np.resize(self._scores, (capacity, self.top_n))
+        row = self._size
+        self._ids[row] = product_id
+        self._vectors[row] = vector
+        self._neighbours[row] = neighbours
+        self._scores[row] = scores
+        self._rows[product_id] = row
+        self._size += 1
+
+    def remove(self, product_ids):
+        with self._lock:
+            for product_id in product_ids:
+                row = self._rows.pop(product_id, None)
+                if row is not None:
+                    # A zero vector never scores above a real neighbour again
+                    self._vectors[row] = 0
+
+    # Lookup
+
+    def product_ids(self) -> list[int]:
+        with self._lock:
+            return list(self._rows)
+
+    def related(self, product_id: int, limit: int) -> list | None:
+        """(product_id, score) pairs, or None if the product isn't indexed."""
+        with self._lock:
+            row = self._rows.get(product_id)
+            if row is None:
+                return None
+            pairs = zip(self._neighbours[row].tolist(), self._scores[row].tolist())
+            return [(other, score) for other, score in pairs if other in self._rows][:limit]
+
+    # Persistence
+
+    def save(self, path: str = RELATED_INDEX_PATH):
+        with self._lock:
+            size = self._size
+            np.savez(
+                path,
+                ids=self._ids[:size],
+                vectors=self._vectors[:size],
+                neighbours=self._neighbours[:size],
+                scores=self._scores[:size],
+                df=self._df,
+                docs=np.array(self._docs),
+                live=np.array(list(self._rows), dtype=np.int64),
+            )
+
+    def load(self, path: str = RELATED_INDEX_PATH) -> bool:
+        if not Path(path).exists():
+            return False
+        data = np.load(path)
+        if data["vectors"].shape[1] != TEXT_DIM + CATEGORICAL_DIM or data["neighbours"].shape[1] != self.top_n:
+            logger.warning("Ignoring related index built with different settings", extra={"path": path})
+            return False
+        with self._lock:
+            self._ids = data["ids"]
+            self._vectors = data["vectors"]
+            self._neighbours = data["neighbours"]
+            self._scores = data["scores"]
+            self._df = data["df"]
+            self._docs = int(data["docs"])
+            self._size = len(self._ids)
+            live = set(data["live"].tolist())
+            self._rows = {int(product_id): row for row, product_id in enumerate(self._ids) if int(product_id) in live}
+            self.ready = True
+        return True
+
+
+related_index = RelatedIndex()
+
+
+# Product columns the index is built from, in RelatedIndex.add() order
+RELATED_COLUMNS = ("name", "description", "brand_id", "subcategory_id")
+
+# CATALOG version the index was last synced against
+_synced_version = None
+
+
+def related_rows(session: Session, product_ids: list[int] = None) -> list:
+    """RelatedIndex.add() arguments for the given products, or for all of them."""
+    query = select(
+        Product.id, Product.name, Product.description, Product.brand_id, Product.subcategory_id
+    ).order_by(Product.id)
+    if product_ids is None:
+        return [tuple(row) for row in session.exec(query).all()]
+    rows = []
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        batch = product_ids[start:start + BATCH_SIZE]
+        rows.extend(tuple(row) for row in session.exec(query.where(Product.id.in_(batch))).all())
+    return rows
+
+
+def rebuild_related_index(session: Session, path: str = RELATED_INDEX_PATH):
+    """Offline job: recompute every product's neighbours and save them."""
+    related_index.build(related_rows(session))
+    related_index.save(path)
+
+
+def sync_related_index(session: Session) -> int:
+    """Fold in products added, and drop products deleted, by any process.
+
+    Every product add and delete bumps the CATALOG version, so this is a
+    single version lookup unless something changed. Returns the number of
+    products added or removed.
+    """
+    global _synced_version
+    version = current_version(session, CATALOG)
+    if version == _synced_version:
+        return 0
+    current = set(session.exec(select(Product.id)).scalars().all())
+    indexed = set(related_index.product_ids())
+    removed = indexed - current
+    related_index.remove(removed)
+    added = related_rows(session, sorted(current - indexed))
+    related_index.add_many(added)
+    _synced_version = version
+    return len(removed) + len(added)
+
+
+def load_related_index(session: Session, path: str = RELATED_INDEX_PATH):
+    """Load the saved index, fold in products changed since it was built, or build one."""
+    if not related_index.load(path):
+        rebuild_related_index(session, path)
+        return
+    if sync_related_index(session):
+        related_index.save(path)
+
+
+if __name__ == "__main__":
+    from db import engine
+
+    from log import setup_logging
+
+    setup_logging()
+    with Session(engine) as session:
+        rebuild_related_index(session)
+    logger.info("Related products index written", extra={"path": RELATED_INDEX_PATH})
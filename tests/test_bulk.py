@@ -0,0 +1,107 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from bulk import _value, bulk_delete, bulk_update
+from models.brands import Brand
+from models.categories import Category
+from models.inventory import Reservation, StockShard
+from models.products import Product
+from models.ratings import Rating
+from models.subcategories import SubCategory
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Category(id=1, name="Shoes"))
+        session.add(Category(id=2, name="Hats"))
+        session.add(Brand(id=1, name="Nike"))
+        session.add(SubCategory(id=1, name="Running", category_id=1))
+        session.add(SubCategory(id=2, name="Caps", category_id=2))
+        for product_id, subcategory_id in ((1, 1), (2, 1), (3, 2)):
+            session.add(Product(
+                id=product_id, name=f"Product {product_id}", brand_id=1,
+                category_id=subcategory_id, subcategory_id=subcategory_id,
+                price=10, description="", rating_value=40, rating_count=10,
+            ))
+        session.commit()
+        session.add(Rating(product_id=1, value=5))
+        session.add(StockShard(product_id=1, shard=0, available=3))
+        session.add(Reservation(product_id=2, shard=0, quantity=1, expires_at=datetime(2030, 1, 1, tzinfo=timezone.utc)))
+        session.commit()
+        yield session
+
+
+def ids(session, model):
+    return sorted(session.exec(select(model.id)).all())
+
+
+def test_delete_refuses_referenced_rows_without_cascade(session):
+    with pytest.raises(HTTPException) as e:
+        bulk_delete(session, Category, [1], {}, cascade=False)
+
+    assert e.value.status_code == 409
+    assert ids(session, Category) == [1, 2]
+
+
+def test_cascade_walks_every_level(session):
+    result, product_ids = bulk_delete(session, Category, [1], {}, cascade=True)
+    session.commit()
+
+    assert result["deleted"] == [1]
+    assert result["dependents"] == {
+        "products": 2, "ratings": 1, "stock_shards": 1, "reservations": 1, "subcategories": 1,
+    }
+    assert sorted(product_ids) == [1, 2]
+    assert ids(session, Product) == [3]
+    assert ids(session, SubCategory) == [2]
+    assert session.exec(select(Rating)).all() == []
+    assert session.exec(select(StockShard)).all() == []
+    assert session.exec(select(Reservation)).all() == []
+
+
+def test_cascade_from_product_collects_its_own_ids(session):
+    result, product_ids = bulk_delete(session, Product, None, {"subcategory_id": 1}, cascade=True)
+
+    assert sorted(result["deleted"]) == [1, 2]
+    assert sorted(product_ids) == [1, 2]
+
+
+@pytest.mark.parametrize("name, value, expected", [
+    ("price", "19.5", 19.5),
+    ("rating_count", 7, 7),
+    ("image_url", None, None),
+])
+def test_value_coerces_to_the_field_type(name, value, expected):
+    assert _value(Product, name, value) == expected
+
+
+@pytest.mark.parametrize("name, value", [
+    ("price", "cheap"),
+    ("rating_count", [1]),
+    ("name", None),
+])
+def test_value_rejects_the_wrong_type(name, value):
+    with pytest.raises(HTTPException) as e:
+        _value(Product, name, value)
+    assert e.value.status_code == 422
+
+
+@pytest.mark.parametrize("name", ["id", "rating_sum", "nope"])
+def test_value_rejects_columns_outside_the_request_surface(name):
+    with pytest.raises(HTTPException) as e:
+        _value(Product, name, 1)
+    assert e.value.status_code == 400
+
+
+def test_update_cannot_set_or_filter_on_rating_sum(session):
+    with pytest.raises(HTTPException):
+        bulk_update(session, Product, None, {}, {"rating_sum": 0})
+    with pytest.raises(HTTPException):
+        bulk_update(session, Product, None, {"rating_sum": 400}, {"price": 1})
@@ -0,0 +1,118 @@
+import random
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+from models.brands import Brand
+from models.categories import Category
+from models.products import Product
+from models.subcategories import SubCategory
+from rankings import RankingIndex, bayesian_score, ranking_rows
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Category(id=1, name="Shoes"))
+        session.add(Category(id=2, name="Hats"))
+        session.add(Brand(id=1, name="Nike"))
+        session.add(SubCategory(id=1, name="Running", category_id=1))
+        session.add(SubCategory(id=2, name="Trail", category_id=1))
+        session.add(SubCategory(id=3, name="Caps", category_id=2))
+        # (id, subcategory_id, rating_value, rating_count)
+        for product_id, subcategory_id, value, count in (
+            (1, 1, 45, 10), (2, 1, 40, 500), (3, 2, 30, 50), (4, 3, 50, 1),
+        ):
+            session.add(Product(
+                id=product_id, name=f"Product {product_id}", brand_id=1,
+                category_id=1 if subcategory_id < 3 else 2, subcategory_id=subcategory_id,
+                price=10, description="", rating_value=value, rating_count=count,
+            ))
+        session.commit()
+        yield session
+
+
+@pytest.fixture
+def index(session):
+    index = RankingIndex()
+    index.rebuild(session, 1)
+    return index
+
+
+def ids(ranked):
+    return [product_id for product_id, _ in ranked]
+
+
+def test_rebuild_ranks_each_scope(index):
+    assert ids(index.top("popular")) == [2, 3, 1, 4]
+    assert ids(index.top("popular", category_id=2)) == [4]
+    assert ids(index.top("popular", subcategory_id=1)) == [2, 1]
+    assert ids(index.top("popular", k=2)) == [2, 3]
+    # A single 5.0 vote barely lifts product 4 off the catalog mean
+    assert ids(index.top("top_rated")) == [1, 2, 4, 3]
+
+
+def test_upsert_moves_a_product_between_scopes(index):
+    index.upsert(2, [(1, 2, 2, 45, 1000)])
+
+    assert index.is_current(2)
+    assert ids(index.top("popular", subcategory_id=1)) == [2]
+    assert ids(index.top("popular", subcategory_id=2)) == [1, 3]
+    assert ids(index.top("popular")) == [1, 2, 3, 4]
+
+
+def test_remove_drops_every_entry(index):
+    index.remove(2, [2, 4])
+
+    assert ids(index.top("popular")) == [3, 1]
+    assert index.top("popular", category_id=2) == []
+    assert index.top("top_rated", subcategory_id=1)[0][0] == 1
+
+
+def test_writes_out_of_version_order_leave_the_index_stale(index):
+    # Version 2 came from another process; applying 3 on top would skip it
+    index.upsert(3, [(1, 1, 1, 45, 1000)])
+
+    assert not index.is_current(3)
+    assert ids(index.top("popular", k=1)) == [2]
+
+
+def test_writes_already_seen_by_a_rebuild_are_skipped(index):
+    index.upsert(1, [(5, 1, 1, 45, 1000)])
+
+    assert index.is_current(1)
+    assert 5 not in ids(index.top("popular"))
+
+
+def test_incremental_updates_match_a_rebuild(session, index):
+    rng = random.Random(7)
+    version = 1
+    for _ in range(200):
+        product = session.get(Product, rng.randint(1, 4))
+        product.subcategory_id = rng.randint(1, 3)
+        product.category_id = 1 if product.subcategory_id < 3 else 2
+        product.rating_count = rng.randint(0, 100)
+        session.add(product)
+        session.commit()
+        version += 1
+        index.upsert(version, [(
+            product.id, product.category_id, product.subcategory_id,
+            product.rating_value, product.rating_count,
+        )])
+
+    # Scores keep the prior mean of the first build, so compare with that
+    fresh = RankingIndex()
+    fresh._prior_mean = index._prior_mean
+    for row in ranking_rows(session, [1, 2, 3, 4]):
+        fresh._insert(*row)
+    for sort in ("top_rated", "popular"):
+        for scope in ({}, {"category_id": 1}, {"category_id": 2}, {"subcategory_id": 3}):
+            assert index.top(sort, k=100, **scope) == fresh.top(sort, k=100, **scope)
+
+
+def test_bayesian_score_pulls_small_samples_to_the_mean():
+    assert bayesian_score(50, 1, 40, prior_weight=50) == pytest.approx(40 + 10 / 51)
+    assert bayesian_score(50, 0, 40) == 40
@@ -0,0 +1,95 @@
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from models.brands import Brand
+from models.categories import Category
+from models.products import Product
+from models.ratings import PendingRating, Rating, RatingFold
+from models.subcategories import SubCategory
+from ratings import fold_ratings, insert_rating
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Category(id=1, name="Shoes"))
+        session.add(Brand(id=1, name="Nike"))
+        session.add(SubCategory(id=1, name="Running", category_id=1))
+        session.add(Product(
+            id=1, name="Runner", brand_id=1, category_id=1, subcategory_id=1,
+            price=10, description="", rating_value=39, rating_count=120,
+        ))
+        session.commit()
+        yield session
+
+
+def product(session):
+    session.expire_all()
+    return session.get(Product, 1)
+
+
+def test_single_votes_are_not_lost_to_rounding(session):
+    # 39 * 120 + 50 / 121 rounds back to 39, so recomputing from the rounded
+    # average would never move; the exact total has to be carried instead
+    for _ in range(50):
+        insert_rating(session, 1, 5)
+        assert fold_ratings(session)["ratings"] == 1
+
+    folded = product(session)
+    assert folded.rating_sum == 39 * 120 + 50 * 50
+    assert folded.rating_count == 170
+    assert folded.rating_value == 42
+
+
+def test_batch_fold_matches_exact_average(session):
+    for value in (1, 2, 3, 4, 5, 5):
+        insert_rating(session, 1, value)
+
+    result = fold_ratings(session)
+
+    assert result["ratings"] == 6
+    assert [tuple(row) for row in result["products"]] == [(1, 1, 1, 39, 126)]
+    assert product(session).rating_sum == 39 * 120 + 200
+
+
+def test_each_vote_is_folded_once(session):
+    insert_rating(session, 1, 4)
+    first = fold_ratings(session)
+    second = fold_ratings(session)
+
+    assert first["ratings"] == 1
+    assert second == {"fold_id": None, "ratings": 0, "rating_ids": [], "products": [], "version": None}
+    assert session.exec(select(PendingRating)).all() == []
+    assert [fold.last_rating_id for fold in session.exec(select(RatingFold))] == first["rating_ids"]
+    # Votes themselves are never rewritten
+    assert len(session.exec(select(Rating)).all()) == 1
+
+
+def test_a_fold_applies_at_most_limit_votes(session):
+    for value in (5, 5, 1):
+        insert_rating(session, 1, value)
+
+    first = fold_ratings(session, limit=2)
+    assert first["ratings"] == 2
+    assert product(session).rating_count == 122
+    second = fold_ratings(session, limit=2)
+    assert second["ratings"] == 1
+    assert second["rating_ids"][0] > first["rating_ids"][-1]
+    assert product(session).rating_sum == 39 * 120 + 110
+
+
+def test_votes_committed_out_of_id_order_are_folded(session):
+    # A vote with a lower id that commits after a fold must still be picked up
+    session.add(Rating(id=10, product_id=1, value=5))
+    session.add(PendingRating(rating_id=10, product_id=1, value=5))
+    session.commit()
+    fold_ratings(session)
+    session.add(Rating(id=5, product_id=1, value=1))
+    session.add(PendingRating(rating_id=5, product_id=1, value=1))
+    session.commit()
+
+    assert fold_ratings(session)["ratings"] == 1
+    assert product(session).rating_count == 122
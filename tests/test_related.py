@@ -0,0 +1,136 @@
+import random
+
+import numpy as np
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+import related
+from models.brands import Brand
+from models.categories import Category
+from models.products import Product
+from models.subcategories import SubCategory
+from related import RelatedIndex, related_rows, sync_related_index
+
+
+WORDS = [
+    "running", "trail", "leather", "boot", "light", "waterproof", "canvas", "classic",
+    "suede", "mesh", "cushioned", "wide", "slim", "winter", "summer", "knit",
+]
+
+
+def products(start, count, seed):
+    rng = random.Random(seed)
+    return [
+        (
+            product_id,
+            " ".join(rng.sample(WORDS, 2)),
+            " ".join(rng.choices(WORDS, k=rng.randint(3, 12))),
+            rng.randint(1, 4),
+            rng.randint(1, 6),
+        )
+        for product_id in range(start, start + count)
+    ]
+
+
+def brute_force(index):
+    """Exact neighbours of every live product, from the index's own vectors."""
+    size = index._size
+    live = np.array([row in index._rows.values() for row in range(size)])
+    vectors = index._vectors[:size]
+    sims = vectors @ vectors.T
+    np.fill_diagonal(sims, -np.inf)
+    sims[:, ~live] = -np.inf
+    expected = {}
+    for product_id, row in index._rows.items():
+        order = np.argsort(-sims[row], kind="stable")[:index.top_n]
+        expected[product_id] = (index._ids[order], sims[row, order])
+    return expected
+
+
+def assert_matches_brute_force(index):
+    for product_id, (ids, scores) in brute_force(index).items():
+        row = index._rows[product_id]
+        # Ties may come back in either order, so compare the scores exactly
+        # and the ids as a set
+        np.testing.assert_allclose(index._scores[row], scores, rtol=1e-5)
+        assert set(index._neighbours[row].tolist()) == set(ids.tolist())
+
+
+def test_incremental_adds_match_brute_force():
+    index = RelatedIndex(top_n=5)
+    index.build(products(1, 40, seed=1))
+    for product in products(41, 60, seed=2):
+        index.add(*product)
+
+    assert index._size == 100
+    assert_matches_brute_force(index)
+
+
+def test_adds_into_an_empty_index():
+    index = RelatedIndex(top_n=5)
+    index.build([])
+    for product in products(1, 12, seed=3):
+        index.add(*product)
+
+    assert_matches_brute_force(index)
+
+
+def test_edit_moves_the_product_in_every_list():
+    index = RelatedIndex(top_n=5)
+    catalog = products(1, 50, seed=4)
+    index.build(catalog)
+    index.add(7, "waterproof winter boot", "leather boot waterproof winter", 2, 3)
+
+    assert index._size == 50
+    row = index._rows[7]
+    sims = index._vectors[:50] @ index._vectors[row]
+    sims[row] = -np.inf
+    assert index._scores[row].tolist() == pytest.approx(np.sort(sims)[::-1][:5].tolist(), rel=1e-5)
+    for other in range(50):
+        neighbours = index._neighbours[other].tolist()
+        assert len(set(neighbours) - {-1}) == len([n for n in neighbours if n != -1])
+        if 7 in neighbours:
+            score = index._scores[other][neighbours.index(7)]
+            assert score == pytest.approx(sims[other], rel=1e-5)
+
+
+def test_removed_products_are_not_returned():
+    index = RelatedIndex(top_n=5)
+    index.build(products(1, 20, seed=5))
+    index.remove([3, 4])
+
+    assert index.related(3, 5) is None
+    for product_id in index.product_ids():
+        assert {3, 4}.isdisjoint(other for other, _ in index.related(product_id, 5))
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Category(id=1, name="Shoes"))
+        session.add(Brand(id=1, name="Nike"))
+        session.add(SubCategory(id=1, name="Running", category_id=1))
+        for product_id, name, description, _, _ in products(1, 10, seed=6):
+            session.add(Product(
+                id=product_id, name=name, brand_id=1, category_id=1, subcategory_id=1,
+                price=10, description=description,
+            ))
+        session.commit()
+        yield session
+
+
+def test_sync_folds_in_other_processes_writes(session, monkeypatch):
+    index = RelatedIndex(top_n=5)
+    index.build(related_rows(session, [1, 2, 3, 4, 5, 6, 7, 8]))
+    monkeypatch.setattr(related, "related_index", index)
+    monkeypatch.setattr(related, "_synced_version", None)
+    session.delete(session.get(Product, 2))
+    session.commit()
+
+    assert sync_related_index(session) == 3
+    assert sorted(index.product_ids()) == [1, 3, 4, 5, 6, 7, 8, 9, 10]
+    # Nothing changed since, so the next sync is a version check only
+    assert sync_related_index(session) == 0
@@ -0,0 +1,33 @@
+from sqlalchemy import select, update
+from sqlmodel import Session
+
+from models.versions import CacheVersion
+
+
+# Cached views and the writes that change them
+CATALOG = "catalog"  # categories, subcategories, product counts
+RANKINGS = "rankings"  # product ratings and their category/subcategory
+
+
+def bump_version(session: Session, name: str) -> int:
+    """Advance a cache version as part of the caller's transaction.
+
+    Commit it together with the write it describes. The row stays locked until
+    then, so concurrent bumps of the same name are serialized.
+    """
+    stmt = update(CacheVersion).where(CacheVersion.name == name).values(
+        version=CacheVersion.version + 1
+    ).returning(CacheVersion.version)
+    version = session.exec(stmt, execution_options={"synchronize_session": False}).scalar_one_or_none()
+    if version is None:
+        # Only on databases created with create_all(); the migration seeds the rows
+        session.add(CacheVersion(name=name, version=1))
+        session.flush()
+        version = 1
+    return version
+
+
+def current_version(session: Session, name: str) -> int:
+    """The latest committed version, as a single primary key lookup."""
+    stmt = select(CacheVersion.version).where(CacheVersion.name == name)
+    return session.exec(stmt).scalar_one_or_none() or 0